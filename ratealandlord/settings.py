@@ -14,6 +14,7 @@ import os
 from pathlib import Path
 from dotenv import load_dotenv
 import dj_database_url
+from boto3.s3.transfer import TransferConfig
 
 # Load environment variables from .env file
 load_dotenv(".venv/.env")
@@ -29,7 +30,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # Removed sensitive information
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# Hashed static filenames (and so their long cache lifetimes) only apply with DEBUG off
+DEBUG = os.getenv('DEBUG', 'True') == 'True'
 
 ALLOWED_HOSTS = ['localhost','127.0.0.1','https://tenant-talk.com/', 'tenant-talk-95349b023e8e.herokuapp.com']
 
@@ -45,6 +47,8 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
+    # runserver serves static files through WhiteNoise too, as in production
+    'whitenoise.runserver_nostatic',
     'django.contrib.staticfiles',
     "crispy_forms",
     "crispy_bootstrap4",
@@ -66,6 +70,10 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Static files straight from STATIC_ROOT, before any other middleware runs
+    'tenanttalk.staticfiles.StaticFilesMiddleware',
+    # Server-Timing headers and per-view histograms, with INSTRUMENTATION_ENABLED
+    'tenanttalk.instrumentation.InstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -81,7 +89,8 @@ ROOT_URLCONF = 'ratealandlord.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing each render for the instrumentation
+        'BACKEND': 'tenanttalk.instrumentation.TimedTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -118,6 +127,58 @@ else:
 
 
 
+# Reports per page on the home feed and My Account
+REPORTS_PER_PAGE = int(os.getenv('REPORTS_PER_PAGE', 3))
+SEARCH_RESULTS_PER_PAGE = int(os.getenv('SEARCH_RESULTS_PER_PAGE', 10))
+# Deepest search page served; ?page= beyond it gets this page
+SEARCH_MAX_PAGE = int(os.getenv('SEARCH_MAX_PAGE', 100))
+# Reports per load in each column of the staff moderation queue
+STAFF_QUEUE_PAGE_SIZE = int(os.getenv('STAFF_QUEUE_PAGE_SIZE', 20))
+# Reports per page of the read API at /api/reports/
+API_REPORTS_PER_PAGE = int(os.getenv('API_REPORTS_PER_PAGE', 20))
+
+
+# Cache
+# Local memory by default. Set REDIS_URL to share one cache between dynos
+# (needs the redis package), or CACHE_DIR for a file-based cache on a single machine.
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+elif os.getenv('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds a page of the public feed stays cached. Moderation clears it sooner.
+FEED_CACHE_TIMEOUT = int(os.getenv('FEED_CACHE_TIMEOUT', 600))
+# Moderation clears the feed cache through a version number kept in the
+# cache, so every worker has to share it. With per-process local memory the
+# other workers would show the old feed for up to FEED_CACHE_TIMEOUT, so the
+# feed is not cached at all there.
+FEED_CACHE_ENABLED = CACHES['default']['BACKEND'] != 'django.core.cache.backends.locmem.LocMemCache'
+
+# Time each request's SQL, S3 calls and template rendering, reported in a
+# Server-Timing header and as per-view histograms at /metrics/
+INSTRUMENTATION_ENABLED = os.getenv('INSTRUMENTATION_ENABLED', 'False') == 'True'
+# Lets a Prometheus scraper read /metrics/ with "Authorization: Bearer <token>";
+# otherwise the page is staff only
+INSTRUMENTATION_METRICS_TOKEN = os.getenv('INSTRUMENTATION_METRICS_TOKEN', '')
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -154,6 +215,8 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+# collectstatic leaves Brotli/gzip copies alone when their source is unchanged
+STATICFILES_SKIP_UNCHANGED = os.getenv('STATICFILES_SKIP_UNCHANGED', 'True') == 'True'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -193,14 +256,33 @@ LOGOUT_REDIRECT_URL = '/'
 
 # Storage Stuff
 
-STORAGES = {
-    "default": {
-        "BACKEND": "storages.backends.s3.S3Storage",
-    },
-    "staticfiles": {
-        "BACKEND": "storages.backends.s3.S3Storage",
+# FILE_STORAGE=local keeps attachments under MEDIA_ROOT instead of S3, for
+# development and on-prem installs without AWS (tenanttalk/file_store.py)
+FILE_STORAGE = os.getenv('FILE_STORAGE', 's3')
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', os.path.join(BASE_DIR, 'media'))
+
+if FILE_STORAGE == 'local':
+    STORAGES = {
+        "default": {
+            "BACKEND": "django.core.files.storage.FileSystemStorage",
+        },
+        "staticfiles": {
+            "BACKEND": "tenanttalk.staticfiles.StaticFilesStorage",
+        }
     }
-}
+    ATTACHMENT_FILE_STORE = 'tenanttalk.file_store.LocalFileStore'
+else:
+    STORAGES = {
+        # S3Storage with its API calls counted by the instrumentation
+        "default": {
+            "BACKEND": "tenanttalk.s3.S3Storage",
+        },
+        # Static files stay with the app (WhiteNoise) rather than S3
+        "staticfiles": {
+            "BACKEND": "tenanttalk.staticfiles.StaticFilesStorage",
+        }
+    }
+    ATTACHMENT_FILE_STORE = 'tenanttalk.file_store.S3FileStore'
 
 #STATICFILES_STORAGE = "storages.backends.s3.S3Storage"
 #DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
@@ -210,6 +292,53 @@ AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
 AWS_STORAGE_BUCKET_NAME = os.getenv('S3_BUCKET_NAME')
 AWS_S3_REGION_NAME = os.getenv('AWS_S3_REGION_NAME')  # e.g., 'us-west-2'
 
+# Report attachments are streamed to storage in chunks and capped in size.
+# Anything over the memory limit is spooled to a temp file rather than RAM.
+REPORT_UPLOAD_MAX_SIZE = int(os.getenv('REPORT_UPLOAD_MAX_SIZE', 25 * 1024 * 1024))
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440  # 2.5 MB
+REPORT_UPLOAD_WORKERS = int(os.getenv('REPORT_UPLOAD_WORKERS', 6))
+FILE_UPLOAD_HANDLERS = [
+    'tenanttalk.uploads.UploadSizeLimitHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+# The report form sends attachments straight to S3 with a presigned POST
+# (the bucket needs a CORS rule allowing POST from the site)
+REPORT_DIRECT_UPLOADS = os.getenv('REPORT_DIRECT_UPLOADS', 'True') == 'True'
+DIRECT_UPLOAD_EXPIRES = 900
+# Signed browser uploads each logged-in user may ask for per hour
+DIRECT_UPLOAD_HOURLY_LIMIT = int(os.getenv('DIRECT_UPLOAD_HOURLY_LIMIT', 20))
+# Browser uploads still not part of a report after this long are deleted by
+# purge_direct_uploads (run it daily, e.g. from Heroku Scheduler)
+DIRECT_UPLOAD_ORPHAN_HOURS = int(os.getenv('DIRECT_UPLOAD_ORPHAN_HOURS', 24))
+# s3transfer's own threads don't carry the request's context, so with the
+# instrumentation on, parts go up one after another on the uploading thread
+# to be counted
+AWS_S3_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=2,
+    use_threads=not INSTRUMENTATION_ENABLED,
+)
+
+# Shared S3 client (tenanttalk/s3.py)
+AWS_S3_MAX_POOL_CONNECTIONS = int(os.getenv('AWS_S3_MAX_POOL_CONNECTIONS', 25))
+# Prefixes listed at once when walking the bucket (tenanttalk/listing.py)
+S3_LISTING_WORKERS = int(os.getenv('S3_LISTING_WORKERS', 8))
+# Files per page of viewuploads
+UPLOADS_PER_PAGE = int(os.getenv('UPLOADS_PER_PAGE', 100))
+PRESIGNED_URL_EXPIRES = 3600  # URL expires in 1 hour
+PRESIGNED_URL_REFRESH_MARGIN = 300  # sign again once a cached URL has 5 minutes left
+PRESIGNED_URL_CACHE_SIZE = int(os.getenv('PRESIGNED_URL_CACHE_SIZE', 2048))
+
+# Thumbnails and PDF previews made by generate_thumbnails (tenanttalk/thumbnails.py)
+THUMBNAIL_SIZE = (320, 320)  # fits within, keeping the aspect ratio
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_PDF_DPI = 72  # or less, if the page would come out bigger than THUMBNAIL_SIZE
+# Failed runs before generate_thumbnails gives up on a file
+THUMBNAIL_MAX_ATTEMPTS = int(os.getenv('THUMBNAIL_MAX_ATTEMPTS', 3))
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', 4))
+
 S3DIRECT_DESTINATIONS = {
     # Allow anybody to upload any MIME type
     'example1': {
@@ -219,6 +348,18 @@ S3DIRECT_DESTINATIONS = {
 
 SOCIALACCOUNT_LOGIN_ON_GET=True
 
+# The test runner has no AWS bucket or secret key, so keep everything local
+if 'test' in sys.argv:
+    SECRET_KEY = 'tenanttalk-test-key'
+    STORAGES = {
+        "default": {
+            "BACKEND": "django.core.files.storage.InMemoryStorage",
+        },
+        "staticfiles": {
+            "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+        }
+    }
+
 # SHERRIFF
 # Activate Django-Heroku.
 # Use this code to avoid the psycopg2 / django-heroku error!
@@ -226,6 +367,7 @@ SOCIALACCOUNT_LOGIN_ON_GET=True
 try:
     if 'HEROKU' in os.environ:
         import django_heroku
-        django_heroku.settings(locals())
+        # Static files are set up above (WhiteNoise, STATIC_ROOT)
+        django_heroku.settings(locals(), staticfiles=False)
 except ImportError:
     found = False
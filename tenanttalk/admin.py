@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Report
+from .models import Report, Attachment, Landlord, Building
 
 admin.site.register(Report)
+admin.site.register(Attachment)
+admin.site.register(Landlord)
+admin.site.register(Building)
 
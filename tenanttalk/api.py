@@ -0,0 +1,137 @@
+import hashlib
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from rest_framework import generics
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework.views import APIView
+
+from .models import Report
+from .moderation import bulk_moderate
+from .pagination import InvalidCursor, KeysetPaginator
+from .serializers import BulkModerationSerializer, ReportSerializer
+from .views import FEED_ORDERING
+
+
+class ReportCursorPagination(BasePagination):
+    """?after= / ?before= keyset cursors in the same order as the home feed."""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        paginator = KeysetPaginator(queryset, FEED_ORDERING, settings.API_REPORTS_PER_PAGE)
+        try:
+            self.page = paginator.page(
+                after=request.query_params.get('after'),
+                before=request.query_params.get('before'),
+            )
+        except InvalidCursor:
+            raise NotFound('Invalid cursor.')
+        return list(self.page)
+
+    def link(self, param, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'before' if param == 'after' else 'after')
+        return replace_query_param(url, param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.link('after', self.page.next_cursor),
+            'previous': self.link('before', self.page.previous_cursor),
+            'results': data,
+        })
+
+
+def resolved_state(request, pk=None):
+    """(newest updated_at, count) of the resolved reports, read from the
+    database so every worker agrees. The conditional-GET functions below
+    both need it, so it is looked up once per request."""
+    if not hasattr(request, '_resolved_state'):
+        reports = Report.objects.filter(status='RESOLVED')
+        if pk is not None:
+            reports = reports.filter(pk=pk)
+        state = reports.aggregate(latest=Max('updated_at'), count=Count('id'))
+        request._resolved_state = (state['latest'], state['count'])
+    return request._resolved_state
+
+
+def report_etag(request, pk=None):
+    latest, count = resolved_state(request, pk)
+    if latest is None:
+        return None
+    # The count catches a resolved report being deleted, which leaves the
+    # newest updated_at where it was
+    key = f"{latest.isoformat()}|{count}|{request.get_full_path()}|{request.headers.get('Accept', '')}"
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def report_last_modified(request, pk=None):
+    return resolved_state(request, pk)[0]
+
+
+class ReportAPIMixin:
+    """Resolved reports, read only, with ?fields=id,post_title,... to pick
+    the fields returned. Responses carry ETag and Last-Modified so clients
+    can poll with If-None-Match / If-Modified-Since and get 304s."""
+
+    serializer_class = ReportSerializer
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def requested_fields(self):
+        fields = self.request.query_params.get('fields')
+        if not fields:
+            return None
+        fields = [name.strip() for name in fields.split(',') if name.strip()]
+        unknown = set(fields) - set(ReportSerializer.Meta.fields)
+        if unknown:
+            raise ValidationError({'fields': f"Unknown fields: {', '.join(sorted(unknown))}"})
+        return fields
+
+    def get_queryset(self):
+        reports = Report.objects.filter(status='RESOLVED')
+        fields = self.requested_fields()
+        if fields is not None:
+            # Only load the columns asked for, plus the ones the cursor needs
+            columns = {ReportSerializer.SOURCES.get(name, name) for name in fields}
+            columns.update(name.lstrip('-') for name in FEED_ORDERING)
+            reports = reports.only(*columns)
+        return reports
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs['fields'] = self.requested_fields()
+        return super().get_serializer(*args, **kwargs)
+
+
+@method_decorator(condition(etag_func=report_etag, last_modified_func=report_last_modified), name='get')
+class ReportListView(ReportAPIMixin, generics.ListAPIView):
+    pagination_class = ReportCursorPagination
+
+
+@method_decorator(condition(etag_func=report_etag, last_modified_func=report_last_modified), name='get')
+class ReportDetailView(ReportAPIMixin, generics.RetrieveAPIView):
+    pass
+
+
+class BulkModerationView(APIView):
+    """POST {"ids": [...], "action": "in_progress" | "resolve" | "deny" | "feedback",
+    "feedback": "..."} to moderate many reports at once. Staff only."""
+
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        serializer = BulkModerationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        results = bulk_moderate(**serializer.validated_data)
+        return Response({
+            'action': serializer.validated_data['action'],
+            'results': [{'id': pk, 'result': result} for pk, result in results.items()],
+        })
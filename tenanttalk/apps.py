@@ -5,3 +5,11 @@ class TenanttalkConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tenanttalk'
 
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from .instrumentation import instrument_connection
+
+        connection_created.connect(instrument_connection)
+
@@ -0,0 +1,60 @@
+import mimetypes
+from bisect import bisect_left
+
+from .models import Attachment
+from .file_store import get_file_store
+
+
+UPLOADS_PREFIX = 'uploads/'
+# Where report() put files before uploads/ existed. No Attachment rows point
+# there, so the uploads page reaches them only by listing the bucket.
+LEGACY_PREFIXES = ('pdfs/', 'txts/', 'jpgs/')
+BUCKET_PREFIXES = (UPLOADS_PREFIX, *LEGACY_PREFIXES)
+
+
+def legacy_report_prefix(report):
+    # Folder layout report() used before files were keyed by report id
+    post_id = report.post_title + '-' + report.time_stamp.strftime('%Y%m%d-%H%M')
+    return f'uploads/{report.user}/{post_id}/'
+
+
+def list_upload_objects():
+    """Every object under uploads/, sorted by key. Each user's folder is
+    listed concurrently and paged through to the end."""
+    return get_file_store().list_tree(UPLOADS_PREFIX)
+
+
+def objects_with_prefix(objects, keys, prefix):
+    start = bisect_left(keys, prefix)
+    matches = []
+    for obj in objects[start:]:
+        if not obj['Key'].startswith(prefix):
+            break
+        matches.append(obj)
+    return matches
+
+
+def backfill_attachments(reports):
+    """Record Attachment rows for files uploaded before the manifest existed.
+
+    Returns the number of rows created. Keys that already have a row are
+    skipped, so running it twice is harmless.
+    """
+    objects = list_upload_objects()
+    keys = [obj['Key'] for obj in objects]
+    known = set(Attachment.objects.values_list('key', flat=True))
+
+    created = []
+    for report in reports:
+        for obj in objects_with_prefix(objects, keys, legacy_report_prefix(report)):
+            if obj['Key'] in known:
+                continue
+            known.add(obj['Key'])
+            created.append(Attachment(
+                report=report,
+                key=obj['Key'],
+                size=obj.get('Size', 0),
+                content_type=mimetypes.guess_type(obj['Key'])[0] or '',
+            ))
+    Attachment.objects.bulk_create(created)
+    return len(created)
@@ -0,0 +1,215 @@
+import csv
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from django.utils import timezone
+
+from .feed_cache import invalidate_feed
+from .models import Building, Landlord, Report, report_content_hash
+
+
+# Columns written by export and read by import, in file order
+REPORT_FIELDS = (
+    'id', 'post_title', 'building_address', 'landlord_name', 'report',
+    'time_stamp', 'status', 'verify', 'feedback', 'user',
+)
+REQUIRED_FIELDS = ('post_title', 'building_address', 'landlord_name', 'report')
+# Text columns with a length limit; bulk_create would fail the whole batch
+# on Postgres if one row ran over
+LIMITED_FIELDS = ('post_title', 'building_address', 'landlord_name', 'report', 'feedback', 'user')
+# Fields read from a row, all of them strings (id is not read)
+TEXT_FIELDS = REPORT_FIELDS[1:]
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(stream, format):
+    """Rows of an export file, one dict at a time."""
+    if format == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line_number, line in enumerate(stream, 1):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError as error:
+                raise RowError(f"line {line_number}: {error}")
+
+
+def write_rows(stream, format, rows):
+    if format == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(REPORT_FIELDS)
+        writer.writerows(rows)
+        return
+    for row in rows:
+        stream.write(json.dumps(dict(zip(REPORT_FIELDS, row)), default=str) + '\n')
+
+
+class Echo:
+    """File-like object whose write() hands the line back, so csv.writer
+    can feed a streaming response one row at a time."""
+
+    def write(self, value):
+        return value
+
+
+# A cell starting with one of these runs as a formula when the CSV is
+# opened in a spreadsheet
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def spreadsheet_safe(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+async def csv_lines(rows):
+    """CSV lines for staff to open in a spreadsheet, from an async
+    iterator of rows. Tenant-written text that would run as a formula gets a
+    leading apostrophe.
+
+    Async so an ASGI server streams it as it goes; Django reads a sync
+    streaming iterator to the end before sending anything under ASGI.
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(REPORT_FIELDS)
+    async for row in rows:
+        yield writer.writerow([spreadsheet_safe(value) for value in row])
+
+
+def export_values(row):
+    return [value.isoformat() if hasattr(value, 'isoformat') else value for value in row]
+
+
+def export_rows(queryset, chunk_size=2000):
+    """Values of REPORT_FIELDS for every report, streamed from the database
+    ``chunk_size`` rows at a time."""
+    for row in queryset.order_by('id').values_list(*REPORT_FIELDS).iterator(chunk_size=chunk_size):
+        yield export_values(row)
+
+
+async def aexport_rows(queryset, chunk_size=2000):
+    """export_rows() as an async generator, for streaming responses.
+
+    values_list().aiterator() runs its query on the event loop and is
+    refused, so each chunk is pulled from the sync iterator through
+    sync_to_async instead, as aiterator() does for model querysets. The
+    thread-sensitive executor keeps every chunk on the cursor's thread.
+    """
+    rows = export_rows(queryset, chunk_size)
+    next_chunk = sync_to_async(lambda: list(islice(rows, chunk_size)))
+    while chunk := await next_chunk():
+        for row in chunk:
+            yield row
+
+
+def build_report(row):
+    # A JSONL line can hold any JSON value, not just an object of strings
+    if not isinstance(row, dict):
+        raise RowError(f"not an object: {type(row).__name__}")
+    not_text = [
+        field for field in TEXT_FIELDS
+        if row.get(field) is not None and not isinstance(row[field], str)
+    ]
+    if not_text:
+        raise RowError(f"not text: {', '.join(not_text)}")
+    missing = [field for field in REQUIRED_FIELDS if not (row.get(field) or '').strip()]
+    if missing:
+        raise RowError(f"missing {', '.join(missing)}")
+    too_long = [
+        field for field in LIMITED_FIELDS
+        if len(row.get(field) or '') > Report._meta.get_field(field).max_length
+    ]
+    if too_long:
+        raise RowError(f"too long: {', '.join(too_long)}")
+
+    time_stamp = row.get('time_stamp')
+    if time_stamp:
+        time_stamp = parse_datetime(time_stamp)
+        if time_stamp is None:
+            raise RowError(f"bad time_stamp {row['time_stamp']!r}")
+        if timezone.is_naive(time_stamp):
+            time_stamp = timezone.make_aware(time_stamp)
+    status = row.get('status') or 'NEW'
+    if status not in dict(Report.STATUS_CHOICES):
+        raise RowError(f"bad status {status!r}")
+
+    report = Report(
+        post_title=row['post_title'],
+        building_address=row['building_address'],
+        landlord_name=row['landlord_name'],
+        report=row['report'],
+        time_stamp=time_stamp or timezone.now(),
+        status=status,
+        verify='T' if row.get('verify') == 'T' else 'F',
+        feedback=row.get('feedback') or ' ',
+        user=row.get('user') or 'ANONYMOUS',
+    )
+    # bulk_create does not call save(), so do its work here
+    report.content_hash = report_content_hash(
+        report.post_title, report.building_address, report.landlord_name, report.report
+    )
+    report.updated_at = timezone.now()
+    return report
+
+
+def import_batch(reports):
+    """Insert the reports not already stored, returning how many were."""
+    hashes = {report.content_hash for report in reports}
+    seen = set(Report.objects.filter(content_hash__in=hashes).values_list('content_hash', flat=True))
+    fresh = []
+    for report in reports:
+        if report.content_hash not in seen:
+            seen.add(report.content_hash)
+            fresh.append(report)
+    if not fresh:
+        return 0
+
+    with transaction.atomic():
+        landlords = Landlord.for_texts(report.landlord_name for report in fresh)
+        buildings = Building.for_texts(report.building_address for report in fresh)
+        for report in fresh:
+            report.landlord = landlords.get(Landlord.normalize(report.landlord_name))
+            report.building = buildings.get(Building.normalize(report.building_address))
+        Report.objects.bulk_create(fresh)
+        # No post_save either, so the counters are rebuilt for what changed
+        Landlord.recount(*(report.landlord_id for report in fresh))
+        Building.recount(*(report.building_id for report in fresh))
+    return len(fresh)
+
+
+def import_rows(rows, batch_size=1000):
+    """Import rows in batches of ``batch_size``.
+
+    Yields (rows read, rows imported, [(row number, error), ...]) after each
+    batch so the caller can report progress. Rows whose content matches a
+    stored report, or an earlier row, are skipped.
+    """
+    read = imported = 0
+    resolved = False
+    batch, errors = [], []
+    for read, row in enumerate(rows, 1):
+        try:
+            report = build_report(row)
+        except RowError as error:
+            errors.append((read, str(error)))
+            continue
+        resolved = resolved or report.status == 'RESOLVED'
+        batch.append(report)
+        if len(batch) == batch_size:
+            imported += import_batch(batch)
+            batch = []
+            yield read, imported, errors
+            errors = []
+    if batch:
+        imported += import_batch(batch)
+    if resolved:
+        invalidate_feed()
+    yield read, imported, errors
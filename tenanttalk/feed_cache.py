@@ -0,0 +1,62 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .pagination import InvalidCursor, KeysetPaginator, paginate_request
+
+
+FEED_VERSION_KEY = 'tenanttalk:feed-version'
+
+
+def feed_version():
+    version = cache.get(FEED_VERSION_KEY)
+    if version is None:
+        cache.add(FEED_VERSION_KEY, 1, timeout=None)
+        version = cache.get(FEED_VERSION_KEY, 1)
+    return version
+
+
+def invalidate_feed():
+    """Retire every cached feed page by moving to a new version number.
+
+    Old pages are never read again and age out on FEED_CACHE_TIMEOUT.
+    """
+    try:
+        cache.incr(FEED_VERSION_KEY)
+    except ValueError:
+        cache.add(FEED_VERSION_KEY, 1, timeout=None)
+
+
+def cached_feed_page(request, queryset, ordering, per_page):
+    """The keyset page of the public feed for this request's cursor, from the
+    cache when the feed has not changed since it was stored.
+
+    Pages are keyed on the decoded cursor, so a cursor that does not decode
+    shares the first page's entry (it is served the first page anyway)
+    rather than adding one of its own. Without FEED_CACHE_ENABLED this is
+    paginate_request().
+    """
+    if not settings.FEED_CACHE_ENABLED:
+        return paginate_request(request, queryset, ordering, per_page)
+
+    paginator = KeysetPaginator(queryset, ordering, per_page)
+    # page() goes by ?before= when both are given
+    after, before = request.GET.get('after'), request.GET.get('before')
+    direction, cursor = ('before', before) if before else ('after', after)
+    try:
+        values = paginator.decode_cursor(cursor) if cursor else None
+    except InvalidCursor:
+        values = None
+    if values is None:
+        direction = cursor = None
+    position = json.dumps([direction, values], cls=DjangoJSONEncoder)
+    key = f'tenanttalk:feed:{feed_version()}:{per_page}:{hashlib.md5(position.encode()).hexdigest()}'
+
+    page = cache.get(key)
+    if page is None:
+        page = paginator.page(**({direction: cursor} if direction else {}))
+        cache.set(key, page, settings.FEED_CACHE_TIMEOUT)
+    return page
@@ -0,0 +1,221 @@
+"""Where attachment files live, behind one interface so the app runs on S3
+or on local disk (FILE_STORAGE=local) without AWS. Writes go through
+default_storage either way; this covers what Django storages do not:
+listing, links that expire, and browser uploads."""
+
+import mimetypes
+import os
+import re
+from bisect import bisect_right
+
+from asgiref.sync import sync_to_async
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.http import content_disposition_header
+from django.utils.module_loading import import_string
+
+from . import listing
+from .s3 import get_s3_client, presigned_url
+
+
+def get_file_store():
+    return import_string(settings.ATTACHMENT_FILE_STORE)()
+
+
+class S3FileStore:
+    direct_uploads = True
+
+    @property
+    def bucket_name(self):
+        return settings.AWS_STORAGE_BUCKET_NAME
+
+    def url(self, key, filename=None):
+        return presigned_url(self.bucket_name, key, filename)
+
+    def list_tree(self, prefix):
+        return listing.list_tree(self.bucket_name, prefix)
+
+    def list_page(self, prefixes, start_after=None, page_size=100):
+        """One page of objects under any of ``prefixes``, in key order.
+        Returns (objects, key to start the next page after, or None)."""
+        return listing.list_prefixes_page(self.bucket_name, prefixes, start_after=start_after, page_size=page_size)
+
+    def head(self, key):
+        """{'size', 'content_type'} of a stored file, or None if it is missing."""
+        try:
+            head = get_s3_client().head_object(Bucket=self.bucket_name, Key=key)
+        except ClientError:
+            return None
+        return {'size': head['ContentLength'], 'content_type': head.get('ContentType', '')}
+
+    def sign_upload(self, key, content_type):
+        """Presigned POST for one browser upload to ``key``. The policy pins
+        the key, content type and size range."""
+        post = get_s3_client().generate_presigned_post(
+            Bucket=self.bucket_name,
+            Key=key,
+            Fields={'Content-Type': content_type},
+            Conditions=[
+                {'Content-Type': content_type},
+                ['content-length-range', 1, settings.REPORT_UPLOAD_MAX_SIZE],
+            ],
+            ExpiresIn=settings.DIRECT_UPLOAD_EXPIRES,
+        )
+        return {'url': post['url'], 'fields': post['fields']}
+
+    def delete(self, keys):
+        # delete_objects takes at most 1000 keys a call
+        for start in range(0, len(keys), 1000):
+            get_s3_client().delete_objects(Bucket=self.bucket_name, Delete={
+                'Objects': [{'Key': key} for key in keys[start:start + 1000]],
+                'Quiet': True,
+            })
+
+
+FILE_URL_SALT = 'tenanttalk.file_store'
+
+
+class LocalFileStore:
+    """Files under MEDIA_ROOT (default_storage must be a FileSystemStorage).
+
+    Links are signed and expire like presigned S3 URLs, and are served by
+    the attachment_file view.
+    """
+
+    direct_uploads = False
+
+    def path(self, key):
+        return default_storage.path(key)
+
+    def url(self, key, filename=None):
+        # attachment_file() names the file from its Attachment row
+        return reverse('attachment_file', args=[signing.dumps(key, salt=FILE_URL_SALT)])
+
+    @staticmethod
+    def key_for_url(token):
+        """The key a url() token was made for. Raises signing.BadSignature,
+        including when the link has expired."""
+        return signing.loads(token, salt=FILE_URL_SALT, max_age=settings.PRESIGNED_URL_EXPIRES)
+
+    def list_tree(self, prefix):
+        root = default_storage.location
+        objects = []
+        for folder, _, names in os.walk(os.path.join(root, prefix)):
+            for name in names:
+                path = os.path.join(folder, name)
+                key = os.path.relpath(path, root).replace(os.sep, '/')
+                objects.append({'Key': key, 'Size': os.path.getsize(path)})
+        objects.sort(key=lambda obj: obj['Key'])
+        return objects
+
+    def list_page(self, prefixes, start_after=None, page_size=100):
+        objects = sorted((obj for prefix in prefixes for obj in self.list_tree(prefix)), key=lambda obj: obj['Key'])
+        start = bisect_right([obj['Key'] for obj in objects], start_after) if start_after else 0
+        page = objects[start:start + page_size]
+        next_after = page[-1]['Key'] if start + page_size < len(objects) else None
+        return page, next_after
+
+    def head(self, key):
+        if not default_storage.exists(key):
+            return None
+        return {'size': default_storage.size(key), 'content_type': mimetypes.guess_type(key)[0] or ''}
+
+    def sign_upload(self, key, content_type):
+        return None
+
+    def delete(self, keys):
+        for key in keys:
+            default_storage.delete(key)
+
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+def read_chunks(path, start, stop):
+    """file_chunks() for WSGI, where the server iterates in a thread anyway."""
+    with open(path, 'rb') as file:
+        file.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            chunk = file.read(min(FILE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def file_chunks(path, start, stop):
+    """Bytes ``start`` to ``stop`` of a file, one chunk per thread hop.
+
+    Under ASGI Django would collect a sync iterator into a list before
+    sending it, so the file is read from here instead and only the chunk in
+    flight is in memory. The reads don't touch the database, so they skip
+    the thread that sync views and the ORM share.
+    """
+    read = sync_to_async(lambda file, size: file.read(size), thread_sensitive=False)
+    file = await sync_to_async(open, thread_sensitive=False)(path, 'rb')
+    try:
+        file.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            chunk = await read(file, min(FILE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def file_response(request, path, content_type, filename=None, as_attachment=False):
+    """Serve a local file, honouring a single ``Range: bytes=`` header.
+
+    Under ASGI whole files and ranges stream from file_chunks(); under WSGI
+    whole files go out through FileResponse (and the server's file wrapper)
+    and ranges through read_chunks(). The browser is told not to sniff the
+    type, and to download rather than open the file if ``as_attachment``.
+    """
+    size = os.path.getsize(path)
+    is_asgi = isinstance(request, ASGIRequest)
+    match = RANGE_PATTERN.match(request.headers.get('Range', '').strip())
+    if match is None or match.groups() == ('', ''):
+        if is_asgi:
+            response = StreamingHttpResponse(file_chunks(path, 0, size), content_type=content_type)
+            response['Content-Length'] = size
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+        return file_headers(response, filename, as_attachment)
+
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    else:
+        # bytes=-N is the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    if start > end or start >= size:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    chunks = (file_chunks if is_asgi else read_chunks)(path, start, end + 1)
+    response = StreamingHttpResponse(chunks, status=206, content_type=content_type)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = end - start + 1
+    return file_headers(response, filename, as_attachment)
+
+
+def file_headers(response, filename, as_attachment):
+    response['Accept-Ranges'] = 'bytes'
+    response['X-Content-Type-Options'] = 'nosniff'
+    disposition = content_disposition_header(as_attachment, filename)
+    if disposition:
+        response['Content-Disposition'] = disposition
+    else:
+        response.headers.pop('Content-Disposition', None)
+    return response
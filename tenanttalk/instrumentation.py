@@ -0,0 +1,229 @@
+"""Where a request's time goes: SQL, S3 calls and template rendering.
+
+With INSTRUMENTATION_ENABLED, InstrumentationMiddleware times every request,
+sends the breakdown back in a Server-Timing header and adds it to a per-view
+histogram that the metrics view serves in Prometheus' text format. The
+histograms are per process, so each worker reports its own.
+"""
+import contextvars
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.template.backends.django import DjangoTemplates, Template
+
+
+COMPONENTS = ('db', 's3', 'template')
+UNITS = {'db': 'queries', 's3': 'calls', 'template': 'renders'}
+NAMES = {'db': 'SQL', 's3': 'S3 API', 'template': 'template'}
+
+# Upper bounds, in seconds, of the request duration histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# The timings of the request being handled. asgiref copies the context into
+# sync_to_async threads, so S3 pool and database threads add to it too.
+current = contextvars.ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.elapsed = None
+        self.counts = dict.fromkeys(COMPONENTS, 0)
+        self.durations = dict.fromkeys(COMPONENTS, 0.0)
+        self._lock = threading.Lock()
+
+    def add(self, component, seconds):
+        with self._lock:
+            self.counts[component] += 1
+            self.durations[component] += seconds
+
+    def stop(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    def server_timing(self):
+        # Template time includes any queries the template itself runs
+        metrics = [
+            f'{component};dur={self.durations[component] * 1000:.1f};'
+            f'desc="{self.counts[component]} {UNITS[component]}"'
+            for component in COMPONENTS
+        ]
+        metrics.append(f'total;dur={self.elapsed * 1000:.1f}')
+        return ', '.join(metrics)
+
+
+def timed(component, func, *args, **kwargs):
+    timings = current.get()
+    if timings is None:
+        return func(*args, **kwargs)
+    started = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        timings.add(component, time.perf_counter() - started)
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    return timed('db', execute, sql, params, many, context)
+
+
+def instrument_connection(sender, connection, **kwargs):
+    """connection_created receiver: time every query run on ``connection``."""
+    if sql_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sql_wrapper)
+
+
+def s3_call_started(context, **kwargs):
+    context['instrumentation_started'] = time.perf_counter()
+
+
+def s3_call_finished(context, **kwargs):
+    started = context.pop('instrumentation_started', None)
+    timings = current.get()
+    if started is not None and timings is not None:
+        timings.add('s3', time.perf_counter() - started)
+
+
+def instrument_client(client):
+    """Time every API call made through a boto3 client, retries included.
+    Presigning makes no call, so it is not counted."""
+    events = client.meta.events
+    events.register('before-call.s3', s3_call_started)
+    events.register('after-call.s3', s3_call_finished)
+    events.register('after-call-error.s3', s3_call_finished)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        return timed('template', super().render, context, request)
+
+
+class TimedTemplates(DjangoTemplates):
+    """The Django template backend, timing each top-level render. Includes
+    and extends render inside it and are not counted again."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+class ViewStats:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.counts = dict.fromkeys(COMPONENTS, 0)
+        self.durations = dict.fromkeys(COMPONENTS, 0.0)
+
+
+class ViewHistograms:
+    """Request durations and their breakdown per view, since the process
+    started."""
+
+    def __init__(self):
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def observe(self, view, timings):
+        with self._lock:
+            stats = self._views.setdefault(view, ViewStats())
+            for index, bound in enumerate(BUCKETS):
+                if timings.elapsed <= bound:
+                    stats.buckets[index] += 1
+                    break
+            stats.count += 1
+            stats.sum += timings.elapsed
+            for component in COMPONENTS:
+                stats.counts[component] += timings.counts[component]
+                stats.durations[component] += timings.durations[component]
+
+    def clear(self):
+        with self._lock:
+            self._views.clear()
+
+    def exposition(self):
+        """Prometheus text format, version 0.0.4."""
+        with self._lock:
+            views = sorted(self._views.items())
+            lines = [
+                '# HELP tenanttalk_request_duration_seconds Time to handle a request, by view.',
+                '# TYPE tenanttalk_request_duration_seconds histogram',
+            ]
+            for view, stats in views:
+                label = f'view="{escape_label(view)}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS, stats.buckets):
+                    cumulative += count
+                    lines.append(f'tenanttalk_request_duration_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f'tenanttalk_request_duration_seconds_bucket{{{label},le="+Inf"}} {stats.count}')
+                lines.append(f'tenanttalk_request_duration_seconds_sum{{{label}}} {stats.sum}')
+                lines.append(f'tenanttalk_request_duration_seconds_count{{{label}}} {stats.count}')
+
+            for component in COMPONENTS:
+                what = f'{NAMES[component]} {UNITS[component]}'
+                for name, values, help_text in (
+                    (f'tenanttalk_request_{component}_{UNITS[component]}_total', 'counts', f'Number of {what}'),
+                    (f'tenanttalk_request_{component}_seconds_total', 'durations', f'Seconds spent in {what}'),
+                ):
+                    lines.append(f'# HELP {name} {help_text}, by view.')
+                    lines.append(f'# TYPE {name} counter')
+                    for view, stats in views:
+                        lines.append(f'{name}{{view="{escape_label(view)}"}} {getattr(stats, values)[component]}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+histograms = ViewHistograms()
+
+
+class InstrumentationMiddleware:
+    """Times each request and its SQL, S3 and template work.
+
+    Streaming responses are timed until the view returns them, not until
+    the last chunk is sent.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.INSTRUMENTATION_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = current.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = current.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, timings)
+
+    def finish(self, request, response, timings):
+        timings.stop()
+        match = request.resolver_match
+        histograms.observe(match.view_name if match else 'unresolved', timings)
+        response['Server-Timing'] = timings.server_timing()
+        return response
@@ -0,0 +1,90 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .s3 import get_s3_client
+
+
+def iter_objects(bucket_name, prefix, start_after=None):
+    """Every object under ``prefix``, in key order.
+
+    list_objects_v2 returns at most 1000 keys per call; this keeps following
+    NextContinuationToken until S3 reports the listing is no longer truncated.
+    """
+    s3 = get_s3_client()
+    params = {'Bucket': bucket_name, 'Prefix': prefix}
+    if start_after:
+        params['StartAfter'] = start_after
+    while True:
+        response = s3.list_objects_v2(**params)
+        yield from response.get('Contents', [])
+        if not response.get('IsTruncated'):
+            return
+        params['ContinuationToken'] = response['NextContinuationToken']
+
+
+def split_prefix(bucket_name, prefix):
+    """(sub-prefixes one level below ``prefix``, objects directly in it)."""
+    s3 = get_s3_client()
+    prefixes, objects = [], []
+    params = {'Bucket': bucket_name, 'Prefix': prefix, 'Delimiter': '/'}
+    while True:
+        response = s3.list_objects_v2(**params)
+        prefixes.extend(common['Prefix'] for common in response.get('CommonPrefixes', []))
+        objects.extend(response.get('Contents', []))
+        if not response.get('IsTruncated'):
+            return prefixes, objects
+        params['ContinuationToken'] = response['NextContinuationToken']
+
+
+def list_tree(bucket_name, prefix, workers=None):
+    """Every object under ``prefix`` sorted by key, with the sub-prefixes one
+    level down (e.g. uploads/<user>/) listed concurrently."""
+    prefixes, objects = split_prefix(bucket_name, prefix)
+    for listed in concurrently(lambda sub: list(iter_objects(bucket_name, sub)), prefixes, workers):
+        objects.extend(listed)
+    objects.sort(key=lambda obj: obj['Key'])
+    return objects
+
+
+def concurrently(func, items, workers=None):
+    """[func(item) for item in items], on up to S3_LISTING_WORKERS threads."""
+    if not items:
+        return []
+    workers = min(workers or settings.S3_LISTING_WORKERS, len(items))
+    # Each call runs in a copy of this context, so the request's
+    # instrumentation still sees its S3 calls
+    contexts = [contextvars.copy_context() for _ in items]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='s3-list') as pool:
+        return list(pool.map(lambda context, item: context.run(func, item), contexts, items))
+
+
+def list_page(bucket_name, prefix, start_after=None, page_size=100):
+    """One page of objects under ``prefix`` after the key ``start_after``.
+
+    Returns (objects, key to start the next page after, or None).
+    """
+    params = {'Bucket': bucket_name, 'Prefix': prefix, 'MaxKeys': page_size}
+    if start_after:
+        params['StartAfter'] = start_after
+    response = get_s3_client().list_objects_v2(**params)
+    objects = response.get('Contents', [])
+    next_after = objects[-1]['Key'] if response.get('IsTruncated') and objects else None
+    return objects, next_after
+
+
+def merge_pages(pages, page_size):
+    """One page out of several (objects, next_after) pages listed after the
+    same key, each under its own prefix. Keys are unique across prefixes, so
+    the first ``page_size`` keys overall are the next page."""
+    objects = sorted((obj for listed, _ in pages for obj in listed), key=lambda obj: obj['Key'])
+    more = len(objects) > page_size or any(next_after for _, next_after in pages)
+    objects = objects[:page_size]
+    return objects, objects[-1]['Key'] if more and objects else None
+
+
+def list_prefixes_page(bucket_name, prefixes, start_after=None, page_size=100):
+    """list_page() over several prefixes at once, listed concurrently."""
+    pages = concurrently(lambda prefix: list_page(bucket_name, prefix, start_after, page_size), prefixes)
+    return merge_pages(pages, page_size)
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from tenanttalk.attachments import backfill_attachments
+from tenanttalk.models import Report
+
+
+class Command(BaseCommand):
+    help = "Record Attachment rows for uploads saved before the attachment manifest existed"
+
+    def handle(self, *args, **options):
+        created = backfill_attachments(Report.objects.order_by('id'))
+        self.stdout.write(self.style.SUCCESS(f"Recorded {created} attachment(s)"))
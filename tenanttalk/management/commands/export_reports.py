@@ -0,0 +1,47 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from tenanttalk.bulk import export_rows, write_rows
+from tenanttalk.models import Report
+
+
+class Command(BaseCommand):
+    help = "Stream every report to a JSONL or CSV file (or stdout with -)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Output file, or - for stdout")
+        parser.add_argument('--format', choices=['jsonl', 'csv'], help="Defaults to the file extension, else jsonl")
+        parser.add_argument('--status', choices=[status for status, _ in Report.STATUS_CHOICES])
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, path, format, status, chunk_size, **options):
+        format = format or ('csv' if path.endswith('.csv') else 'jsonl')
+        reports = Report.objects.all()
+        if status:
+            reports = reports.filter(status=status)
+
+        started = time.monotonic()
+        count = 0
+
+        def counted(rows):
+            nonlocal count
+            for count, row in enumerate(rows, 1):
+                if count % chunk_size == 0:
+                    self.progress(count, started)
+                yield row
+
+        stream = sys.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+        try:
+            write_rows(stream, format, counted(export_rows(reports, chunk_size)))
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+
+        # Progress goes to stderr so exporting to stdout stays clean
+        self.stderr.write(self.style.SUCCESS(f"Exported {count} report(s) in {time.monotonic() - started:.1f}s"))
+
+    def progress(self, count, started):
+        elapsed = time.monotonic() - started
+        self.stderr.write(f"{count} reports, {count / elapsed:.0f}/s")
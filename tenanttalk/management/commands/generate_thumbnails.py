@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from tenanttalk.models import Attachment
+from tenanttalk.thumbnails import generate_thumbnails, pending_thumbnails
+
+
+class Command(BaseCommand):
+    help = "Make thumbnails and PDF previews for attachments that do not have one yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--workers', type=int)
+        parser.add_argument('--redo', action='store_true', help="Make every thumbnail again")
+        parser.add_argument('--watch', type=int, metavar='SECONDS',
+                            help="Keep running, checking for new attachments this often")
+
+    def handle(self, *args, batch_size, workers, redo, watch, **options):
+        if redo:
+            Attachment.objects.update(thumbnail='', thumbnailed_at=None, thumbnail_failures=0)
+
+        while True:
+            self.run_once(batch_size, workers)
+            if not watch:
+                return
+            close_old_connections()
+            time.sleep(watch)
+
+    def run_once(self, batch_size, workers):
+        made = 0
+        failed_ids = set()
+        while True:
+            batch = list(pending_thumbnails().exclude(id__in=failed_ids)[:batch_size])
+            if not batch:
+                break
+            batch_made, failed = generate_thumbnails(batch, workers)
+            made += batch_made
+            for key, error in failed:
+                self.stderr.write(f"{key}: {error}")
+            # Failed attachments stay pending for the next run, not this one,
+            # until they have failed THUMBNAIL_MAX_ATTEMPTS runs
+            failed_keys = {key for key, _ in failed}
+            failed_ids.update(attachment.id for attachment in batch if attachment.key in failed_keys)
+        if made or failed_ids:
+            self.stdout.write(self.style.SUCCESS(f"Made {made} thumbnail(s), {len(failed_ids)} failed"))
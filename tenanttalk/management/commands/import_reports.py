@@ -0,0 +1,40 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tenanttalk.bulk import RowError, import_rows, read_rows
+
+
+class Command(BaseCommand):
+    help = "Import reports from a JSONL or CSV file (or stdin with -), skipping duplicates"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or - for stdin")
+        parser.add_argument('--format', choices=['jsonl', 'csv'], help="Defaults to the file extension, else jsonl")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, path, format, batch_size, **options):
+        format = format or ('csv' if path.endswith('.csv') else 'jsonl')
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+
+        started = time.monotonic()
+        read = imported = failed = 0
+        try:
+            for read, imported, errors in import_rows(read_rows(stream, format), batch_size):
+                for row_number, error in errors:
+                    self.stderr.write(f"Row {row_number} skipped: {error}")
+                failed += len(errors)
+                elapsed = time.monotonic() - started
+                self.stdout.write(f"{read} rows read, {imported} imported, {read / max(elapsed, 1e-9):.0f} rows/s")
+        except RowError as error:
+            raise CommandError(f"Could not read {path}: {error}")
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        skipped = read - imported - failed
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} report(s), skipped {skipped} duplicate(s) and {failed} bad row(s) "
+            f"in {time.monotonic() - started:.1f}s"
+        ))
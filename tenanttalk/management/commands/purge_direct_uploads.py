@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from tenanttalk.uploads import purge_direct_uploads
+
+
+class Command(BaseCommand):
+    help = "Delete browser uploads that never became part of a report (run daily)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=None,
+                            help="Only uploads older than this (default DIRECT_UPLOAD_ORPHAN_HOURS)")
+
+    def handle(self, *args, **options):
+        deleted = purge_direct_uploads(options['hours'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} orphaned upload(s)"))
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenanttalk', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Attachment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=300, unique=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('content_type', models.CharField(blank=True, max_length=100)),
+                ('checksum', models.CharField(blank=True, max_length=64)),
+                ('report', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attachments', to='tenanttalk.report')),
+            ],
+        ),
+    ]
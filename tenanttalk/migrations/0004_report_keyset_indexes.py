@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenanttalk', '0003_report_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='report',
+            name='report_feed_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='report',
+            name='report_user_idx',
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['status', 'verify', 'time_stamp', 'id'], name='report_feed_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['user', 'time_stamp', 'id'], name='report_user_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:51
+
+import hashlib
+import unicodedata
+
+from django.db import migrations, models
+
+
+# Frozen copies of the models.py helpers as they were when this migration
+# was written, so replaying it gives the same hashes whatever they become
+def normalize_report_text(value):
+    return " ".join(unicodedata.normalize("NFKC", value).casefold().split())
+
+
+def report_content_hash(post_title, building_address, landlord_name, report):
+    parts = [normalize_report_text(part) for part in (post_title, building_address, landlord_name, report)]
+    return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+
+def backfill_content_hash(apps, schema_editor):
+    Report = apps.get_model('tenanttalk', 'Report')
+    batch = []
+    for report in Report.objects.only('post_title', 'building_address', 'landlord_name', 'report').iterator(chunk_size=1000):
+        report.content_hash = report_content_hash(
+            report.post_title, report.building_address, report.landlord_name, report.report
+        )
+        batch.append(report)
+        if len(batch) == 1000:
+            Report.objects.bulk_update(batch, ['content_hash'])
+            batch = []
+    Report.objects.bulk_update(batch, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenanttalk', '0004_report_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+        migrations.RunPython(backfill_content_hash, migrations.RunPython.noop),
+    ]
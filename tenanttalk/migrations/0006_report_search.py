@@ -0,0 +1,79 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:54
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+SEARCH_INDEX = django.contrib.postgres.indexes.GinIndex(
+    django.contrib.postgres.search.SearchVector('post_title', 'building_address', 'landlord_name', 'report', config='english'),
+    name='report_search_idx',
+)
+
+# SQLite has no GIN indexes, so search.py queries an external-content FTS5
+# table kept in step with tenanttalk_report by triggers
+SQLITE_FTS_CREATE = [
+    """CREATE VIRTUAL TABLE tenanttalk_report_fts USING fts5(
+        post_title, building_address, landlord_name, report,
+        content='tenanttalk_report', content_rowid='id'
+    )""",
+    """CREATE TRIGGER tenanttalk_report_fts_insert AFTER INSERT ON tenanttalk_report BEGIN
+        INSERT INTO tenanttalk_report_fts(rowid, post_title, building_address, landlord_name, report)
+        VALUES (new.id, new.post_title, new.building_address, new.landlord_name, new.report);
+    END""",
+    """CREATE TRIGGER tenanttalk_report_fts_delete AFTER DELETE ON tenanttalk_report BEGIN
+        INSERT INTO tenanttalk_report_fts(tenanttalk_report_fts, rowid, post_title, building_address, landlord_name, report)
+        VALUES ('delete', old.id, old.post_title, old.building_address, old.landlord_name, old.report);
+    END""",
+    """CREATE TRIGGER tenanttalk_report_fts_update AFTER UPDATE ON tenanttalk_report BEGIN
+        INSERT INTO tenanttalk_report_fts(tenanttalk_report_fts, rowid, post_title, building_address, landlord_name, report)
+        VALUES ('delete', old.id, old.post_title, old.building_address, old.landlord_name, old.report);
+        INSERT INTO tenanttalk_report_fts(rowid, post_title, building_address, landlord_name, report)
+        VALUES (new.id, new.post_title, new.building_address, new.landlord_name, new.report);
+    END""",
+    "INSERT INTO tenanttalk_report_fts(tenanttalk_report_fts) VALUES ('rebuild')",
+]
+
+SQLITE_FTS_DROP = [
+    "DROP TRIGGER IF EXISTS tenanttalk_report_fts_update",
+    "DROP TRIGGER IF EXISTS tenanttalk_report_fts_delete",
+    "DROP TRIGGER IF EXISTS tenanttalk_report_fts_insert",
+    "DROP TABLE IF EXISTS tenanttalk_report_fts",
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.add_index(apps.get_model('tenanttalk', 'Report'), SEARCH_INDEX)
+    elif schema_editor.connection.vendor == 'sqlite':
+        for statement in SQLITE_FTS_CREATE:
+            schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.remove_index(apps.get_model('tenanttalk', 'Report'), SEARCH_INDEX)
+    elif schema_editor.connection.vendor == 'sqlite':
+        for statement in SQLITE_FTS_DROP:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenanttalk', '0005_report_content_hash'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='report',
+                    index=SEARCH_INDEX,
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(create_search_index, drop_search_index),
+            ],
+        ),
+    ]
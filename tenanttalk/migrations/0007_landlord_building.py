@@ -0,0 +1,139 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:56
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+
+
+# Frozen copies of the models.py helpers as they were when this migration
+# was written, so replaying it links reports the same way whatever they become
+ADDRESS_ABBREVIATIONS = {
+    "street": "st", "avenue": "ave", "road": "rd", "drive": "dr", "boulevard": "blvd",
+    "lane": "ln", "court": "ct", "place": "pl", "circle": "cir", "apartment": "apt",
+    "suite": "ste", "north": "n", "south": "s", "east": "e", "west": "w",
+}
+LANDLORD_SUFFIXES = {"llc", "inc", "co", "corp", "ltd", "lp"}
+
+
+def normalize_report_text(value):
+    return " ".join(unicodedata.normalize("NFKC", value).casefold().split())
+
+
+def normalize_address(value):
+    words = re.findall(r"\w+", normalize_report_text(value))
+    key = " ".join(ADDRESS_ABBREVIATIONS.get(word, word) for word in words)
+    return key[:100].rstrip()
+
+
+def normalize_landlord_name(value):
+    words = re.findall(r"\w+", normalize_report_text(value))
+    while len(words) > 1 and words[-1] in LANDLORD_SUFFIXES:
+        words.pop()
+    return " ".join(words)[:30].rstrip()
+
+
+def link_reports(apps, schema_editor):
+    Report = apps.get_model('tenanttalk', 'Report')
+    Landlord = apps.get_model('tenanttalk', 'Landlord')
+    Building = apps.get_model('tenanttalk', 'Building')
+
+    # view_report() used to store "TRUE" instead of the "T" choice
+    Report.objects.filter(verify='TRUE').update(verify='T')
+
+    # Matching pass: every spelling that normalizes to the same key shares
+    # one entity, named after the first report that used it
+    landlords = {}
+    buildings = {}
+    batch = []
+    for report in Report.objects.only('landlord_name', 'building_address').order_by('id').iterator(chunk_size=1000):
+        landlord_key = normalize_landlord_name(report.landlord_name)
+        if landlord_key:
+            if landlord_key not in landlords:
+                landlords[landlord_key] = Landlord.objects.create(name=report.landlord_name.strip()[:30], normalized=landlord_key)
+            report.landlord = landlords[landlord_key]
+        building_key = normalize_address(report.building_address)
+        if building_key:
+            if building_key not in buildings:
+                buildings[building_key] = Building.objects.create(address=report.building_address.strip()[:100], normalized=building_key)
+            report.building = buildings[building_key]
+        batch.append(report)
+        if len(batch) == 1000:
+            Report.objects.bulk_update(batch, ['landlord', 'building'])
+            batch = []
+    Report.objects.bulk_update(batch, ['landlord', 'building'])
+
+    for model, field in ((Landlord, 'landlord'), (Building, 'building')):
+        stats = (
+            Report.objects.filter(**{f'{field}__isnull': False})
+            .values(field)
+            .annotate(
+                report_count=Count('id'),
+                resolved_count=Count('id', filter=Q(status='RESOLVED')),
+                verified_count=Count('id', filter=Q(verify='T')),
+                latest_report_at=Max('time_stamp'),
+            )
+        )
+        entities = []
+        for row in stats:
+            entities.append(model(
+                pk=row[field],
+                report_count=row['report_count'],
+                resolved_count=row['resolved_count'],
+                verified_count=row['verified_count'],
+                latest_report_at=row['latest_report_at'],
+            ))
+        model.objects.bulk_update(entities, ['report_count', 'resolved_count', 'verified_count', 'latest_report_at'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenanttalk', '0006_report_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Building',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('report_count', models.PositiveIntegerField(default=0)),
+                ('resolved_count', models.PositiveIntegerField(default=0)),
+                ('verified_count', models.PositiveIntegerField(default=0)),
+                ('latest_report_at', models.DateTimeField(blank=True, null=True)),
+                ('address', models.CharField(max_length=100)),
+                ('normalized', models.CharField(max_length=100, unique=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Landlord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('report_count', models.PositiveIntegerField(default=0)),
+                ('resolved_count', models.PositiveIntegerField(default=0)),
+                ('verified_count', models.PositiveIntegerField(default=0)),
+                ('latest_report_at', models.DateTimeField(blank=True, null=True)),
+                ('name', models.CharField(max_length=30)),
+                ('normalized', models.CharField(max_length=30, unique=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='building',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reports', to='tenanttalk.building'),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='landlord',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reports', to='tenanttalk.landlord'),
+        ),
+        migrations.RunPython(link_reports, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenanttalk', '0007_landlord_building'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['status', 'time_stamp', 'id'], name='report_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenanttalk', '0008_report_queue_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachment',
+            name='thumbnail',
+            field=models.CharField(blank=True, max_length=300),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='thumbnailed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenanttalk', '0009_attachment_thumbnail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachment',
+            name='filename',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='attachment',
+            name='key',
+            field=models.CharField(db_index=True, max_length=300),
+        ),
+        migrations.AddConstraint(
+            model_name='attachment',
+            constraint=models.UniqueConstraint(fields=('report', 'key'), name='attachment_report_key_unique'),
+        ),
+    ]
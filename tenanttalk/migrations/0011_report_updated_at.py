@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:51
+
+from django.db import migrations, models
+
+
+def backfill_updated_at(apps, schema_editor):
+    # Moderation times were never stored; the submit time is the best guess
+    Report = apps.get_model('tenanttalk', 'Report')
+    Report.objects.update(updated_at=models.F('time_stamp'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenanttalk', '0010_attachment_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='updated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['status', 'updated_at'], name='report_status_updated_idx'),
+        ),
+    ]
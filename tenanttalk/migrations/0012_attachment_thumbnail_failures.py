@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenanttalk', '0011_report_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachment',
+            name='thumbnail_failures',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
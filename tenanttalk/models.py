@@ -1,4 +1,154 @@
+import hashlib
+import re
+import unicodedata
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
 from django.db import models
+from django.db.models import Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+
+def normalize_report_text(value):
+    # Case, unicode form and runs of whitespace do not make a report different
+    return " ".join(unicodedata.normalize("NFKC", value).casefold().split())
+
+
+def report_content_hash(post_title, building_address, landlord_name, report):
+    parts = [normalize_report_text(part) for part in (post_title, building_address, landlord_name, report)]
+    return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+
+# Spellings that should land on the same building or landlord
+ADDRESS_ABBREVIATIONS = {
+    "street": "st", "avenue": "ave", "road": "rd", "drive": "dr", "boulevard": "blvd",
+    "lane": "ln", "court": "ct", "place": "pl", "circle": "cir", "apartment": "apt",
+    "suite": "ste", "north": "n", "south": "s", "east": "e", "west": "w",
+}
+LANDLORD_SUFFIXES = {"llc", "inc", "co", "corp", "ltd", "lp"}
+
+# Column lengths of the normalized keys. NFKC and casefold() can make text
+# longer ("ß" becomes "ss"), so keys are cut to fit.
+ADDRESS_KEY_LENGTH = 100
+LANDLORD_KEY_LENGTH = 30
+
+
+def normalize_address(value):
+    words = re.findall(r"\w+", normalize_report_text(value))
+    key = " ".join(ADDRESS_ABBREVIATIONS.get(word, word) for word in words)
+    return key[:ADDRESS_KEY_LENGTH].rstrip()
+
+
+def normalize_landlord_name(value):
+    words = re.findall(r"\w+", normalize_report_text(value))
+    while len(words) > 1 and words[-1] in LANDLORD_SUFFIXES:
+        words.pop()
+    return " ".join(words)[:LANDLORD_KEY_LENGTH].rstrip()
+
+
+class ReportStats(models.Model):
+    """Counters kept up to date as reports are saved, so a profile page
+    reads them instead of aggregating over every report."""
+
+    report_count = models.PositiveIntegerField(default=0)
+    resolved_count = models.PositiveIntegerField(default=0)
+    verified_count = models.PositiveIntegerField(default=0)
+    latest_report_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def for_text(cls, value):
+        """The entity ``value`` normalizes to, created on first sight."""
+        key = cls.normalize(value)
+        if not key:
+            return None
+        entity, _ = cls.objects.get_or_create(
+            normalized=key,
+            defaults={cls.display_field: value.strip()[:cls._meta.get_field(cls.display_field).max_length]},
+        )
+        return entity
+
+    @classmethod
+    def for_texts(cls, values):
+        """{normalized key: entity} for many values at once, creating the
+        missing entities in one bulk insert."""
+        names = {}
+        for value in values:
+            key = cls.normalize(value)
+            if key:
+                names.setdefault(key, value.strip()[:cls._meta.get_field(cls.display_field).max_length])
+        if not names:
+            return {}
+        entities = {entity.normalized: entity for entity in cls.objects.filter(normalized__in=names)}
+        missing = [cls(normalized=key, **{cls.display_field: name}) for key, name in names.items() if key not in entities]
+        if missing:
+            # Another writer may create the same key meanwhile; read back
+            # rather than trust the returned objects
+            cls.objects.bulk_create(missing, ignore_conflicts=True)
+            entities.update(
+                (entity.normalized, entity)
+                for entity in cls.objects.filter(normalized__in=[entity.normalized for entity in missing])
+            )
+        return entities
+
+    @classmethod
+    def bump(cls, pk, reports=0, resolved=0, verified=0, time_stamp=None):
+        changes = {
+            "report_count": models.F("report_count") + reports,
+            "resolved_count": models.F("resolved_count") + resolved,
+            "verified_count": models.F("verified_count") + verified,
+        }
+        if time_stamp is not None:
+            changes["latest_report_at"] = Greatest(Coalesce("latest_report_at", Value(time_stamp)), Value(time_stamp))
+        cls.objects.filter(pk=pk).update(**changes)
+
+    @classmethod
+    def recount(cls, *pks):
+        """Rebuild the counters of the given entities from their reports."""
+        pks = {pk for pk in pks if pk is not None}
+        rows = (
+            Report.objects.filter(**{f"{cls.report_field}__in": pks})
+            .values(cls.report_field)
+            .annotate(
+                report_count=models.Count("id"),
+                resolved_count=models.Count("id", filter=models.Q(status="RESOLVED")),
+                verified_count=models.Count("id", filter=models.Q(verify="T")),
+                latest_report_at=models.Max("time_stamp"),
+            )
+        )
+        stats = {row.pop(cls.report_field): row for row in rows}
+        empty = {"report_count": 0, "resolved_count": 0, "verified_count": 0, "latest_report_at": None}
+        cls.objects.bulk_update(
+            [cls(pk=pk, **stats.get(pk, empty)) for pk in pks],
+            list(empty),
+        )
+
+
+class Landlord(ReportStats):
+    name = models.CharField(max_length=30)
+    normalized = models.CharField(max_length=LANDLORD_KEY_LENGTH, unique=True)
+
+    display_field = "name"
+    report_field = "landlord"
+    normalize = staticmethod(normalize_landlord_name)
+
+    def __str__(self):
+        return f"{self.name}"
+
+
+class Building(ReportStats):
+    address = models.CharField(max_length=100)
+    normalized = models.CharField(max_length=ADDRESS_KEY_LENGTH, unique=True)
+
+    display_field = "address"
+    report_field = "building"
+    normalize = staticmethod(normalize_address)
+
+    def __str__(self):
+        return f"{self.address}"
 
 
 class Report(models.Model):
@@ -34,8 +184,125 @@ class Report(models.Model):
         max_length=30,
         default="ANONYMOUS",
     )
+    landlord = models.ForeignKey(
+        Landlord,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="reports",
+    )
+    building = models.ForeignKey(
+        Building,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="reports",
+    )
+    # sha256 of the normalized title, address, landlord and body, used to
+    # spot duplicate submissions with an index lookup
+    content_hash = models.CharField(
+        max_length=64,
+        db_index=True,
+        blank=True,
+        editable=False,
+    )
+    # Last time anything the public API shows changed: the content or the
+    # moderation state. The API's ETag and Last-Modified come from it. Set
+    # by save(), bulk_moderate() and the bulk importer; nullable so adding
+    # it did not rebuild the table (and drop the SQLite search triggers)
+    updated_at = models.DateTimeField(null=True, blank=True, editable=False)
 
+    class Meta:
+        indexes = [
+            # home(): status='RESOLVED' ordered by -verify, -time_stamp, -id
+            models.Index(fields=["status", "verify", "time_stamp", "id"], name="report_feed_keyset_idx"),
+            # Staff moderation queue: one status, oldest first
+            models.Index(fields=["status", "time_stamp", "id"], name="report_queue_idx"),
+            # myaccount(): a user's own reports, newest first
+            models.Index(fields=["user", "time_stamp", "id"], name="report_user_keyset_idx"),
+            # api.py conditional GETs: newest updated_at among resolved reports
+            models.Index(fields=["status", "updated_at"], name="report_status_updated_idx"),
+            # search.py, Postgres only; SQLite uses an FTS5 table instead
+            GinIndex(
+                SearchVector("post_title", "building_address", "landlord_name", "report", config="english"),
+                name="report_search_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.post_title}"
 
+    # Fields remembered at load time so save() and the signals can tell what
+    # actually changed
+    TRACKED_FIELDS = (
+        "status", "verify", "landlord_name", "building_address", "landlord_id", "building_id", "content_hash",
+    )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_state()
+        return instance
+
+    def remember_state(self):
+        self.loaded_state = {field: self.__dict__.get(field) for field in self.TRACKED_FIELDS}
+
+    def loaded(self, field):
+        return getattr(self, "loaded_state", {}).get(field)
+
+    @property
+    def moderation_state(self):
+        return (self.status, self.verify)
+
+    @property
+    def loaded_moderation_state(self):
+        return (self.loaded("status"), self.loaded("verify"))
+
+    def save(self, *args, **kwargs):
+        self.content_hash = report_content_hash(
+            self.post_title, self.building_address, self.landlord_name, self.report
+        )
+        if self.landlord_id is None or self.landlord_name != self.loaded("landlord_name"):
+            self.landlord = Landlord.for_text(self.landlord_name)
+        if self.building_id is None or self.building_address != self.loaded("building_address"):
+            self.building = Building.for_text(self.building_address)
+        if (self.moderation_state != self.loaded_moderation_state
+                or self.content_hash != self.loaded("content_hash")):
+            self.updated_at = timezone.now()
+        super().save(*args, **kwargs)
+
+
+class Attachment(models.Model):
+    report = models.ForeignKey(
+        Report,
+        on_delete=models.CASCADE,
+        related_name="attachments",
+    )
+    # blobs/<sha256> for uploads, shared by every report that attached the
+    # same content; older files keep their uploads/... key
+    key = models.CharField(max_length=300, db_index=True)
+    filename = models.CharField(max_length=100, blank=True)
+    size = models.BigIntegerField(default=0)
+    content_type = models.CharField(max_length=100, blank=True)
+    # sha256 hex digest, blank for files recorded from a bucket listing
+    checksum = models.CharField(max_length=64, blank=True)
+    # Resized copy written by generate_thumbnails, blank until one exists.
+    # thumbnailed_at is set once a file has been tried, even if it had no
+    # thumbnail to give, so it is not tried again
+    thumbnail = models.CharField(max_length=300, blank=True)
+    thumbnailed_at = models.DateTimeField(null=True, blank=True)
+    # Runs that failed on this file; it stops being tried at
+    # THUMBNAIL_MAX_ATTEMPTS, so a broken file is not fetched forever
+    thumbnail_failures = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["report", "key"], name="attachment_report_key_unique"),
+        ]
+
+    @property
+    def name(self):
+        return self.filename or self.key.split('/')[-1]
+
+    def __str__(self):
+        return f"{self.key}"
@@ -0,0 +1,73 @@
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .feed_cache import invalidate_feed
+from .models import Building, Landlord, Report
+
+
+# action: (does it change this report?, field updates, changes the public feed)
+MODERATION_ACTIONS = {
+    'in_progress': (
+        lambda report: report['status'] == 'NEW',
+        {'status': 'IN_PROGRESS'},
+        False,
+    ),
+    'resolve': (
+        lambda report: (report['status'], report['verify']) != ('RESOLVED', 'T'),
+        {'status': 'RESOLVED', 'verify': 'T'},
+        True,
+    ),
+    'deny': (
+        lambda report: (report['status'], report['verify']) != ('RESOLVED', 'F'),
+        {'status': 'RESOLVED', 'verify': 'F'},
+        True,
+    ),
+}
+
+
+def bulk_moderate(ids, action, feedback=''):
+    """Apply one moderation action to many reports in a single transaction.
+
+    The same rules as view_report() apply: resolve accepts verification,
+    deny resolves without it, and leaving feedback moves a NEW report to
+    IN_PROGRESS. Returns {id: 'updated' | 'unchanged' | 'not_found'}.
+    """
+    with transaction.atomic():
+        reports = {
+            report['id']: report
+            for report in Report.objects.select_for_update()
+            .filter(id__in=ids)
+            .values('id', 'status', 'verify', 'feedback', 'landlord_id', 'building_id')
+        }
+
+        if action == 'feedback':
+            matching = [pk for pk, report in reports.items() if report['feedback'] != feedback]
+            changes = {
+                'feedback': feedback,
+                'status': Case(When(status='NEW', then=Value('IN_PROGRESS')), default=F('status')),
+            }
+            changes_feed = False
+        else:
+            applies, changes, changes_feed = MODERATION_ACTIONS[action]
+            matching = [pk for pk, report in reports.items() if applies(report)]
+
+        if matching:
+            # update() skips the post_save signal, so the counters and the
+            # feed cache are brought up to date here
+            Report.objects.filter(id__in=matching).update(updated_at=timezone.now(), **changes)
+            if action != 'feedback':
+                Landlord.recount(*(reports[pk]['landlord_id'] for pk in matching))
+                Building.recount(*(reports[pk]['building_id'] for pk in matching))
+            if changes_feed:
+                invalidate_feed()
+
+    results = {}
+    for pk in ids:
+        if pk not in reports:
+            results[pk] = 'not_found'
+        elif pk in matching:
+            results[pk] = 'updated'
+        else:
+            results[pk] = 'unchanged'
+    return results
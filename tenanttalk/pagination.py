@@ -0,0 +1,111 @@
+import base64
+import json
+
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """Cursor pagination over a fixed ordering, e.g. ('-verify', '-time_stamp', '-id').
+
+    Each page is one ``WHERE (ordering) beyond cursor ... LIMIT per_page + 1``
+    query, so there is no COUNT(*) and no OFFSET no matter how deep the page.
+    The last field of the ordering must be unique so every row has its own
+    position.
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset.order_by(*ordering)
+        self.ordering = [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+        self.per_page = per_page
+        self.model = queryset.model
+
+    def encode_cursor(self, obj):
+        values = []
+        for name, _ in self.ordering:
+            value = getattr(obj, name)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (ValueError, TypeError):
+            raise InvalidCursor(cursor)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise InvalidCursor(cursor)
+        try:
+            return [
+                self.model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(self.ordering, values)
+            ]
+        except Exception:
+            raise InvalidCursor(cursor)
+
+    def _beyond(self, values, forward):
+        # (a, b, c) past (x, y, z) is a past x, or a == x and b past y, ...
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self.ordering, values):
+            lookup = 'lt' if descending == forward else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def page(self, after=None, before=None):
+        """The page following the ``after`` cursor, the page preceding the
+        ``before`` cursor, or the first page. Raises InvalidCursor."""
+        if before:
+            queryset = self.queryset.filter(self._beyond(self.decode_cursor(before), forward=False))
+            reverse = [f'-{name}' if not descending else name for name, descending in self.ordering]
+            rows = list(queryset.order_by(*reverse)[:self.per_page + 1])
+            has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            next_cursor = self.encode_cursor(rows[-1]) if rows else None
+            previous_cursor = self.encode_cursor(rows[0]) if has_more else None
+            return KeysetPage(rows, next_cursor, previous_cursor)
+
+        queryset = self.queryset
+        if after:
+            queryset = queryset.filter(self._beyond(self.decode_cursor(after), forward=True))
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        next_cursor = self.encode_cursor(rows[-1]) if has_more else None
+        previous_cursor = self.encode_cursor(rows[0]) if after and rows else None
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+
+def paginate_request(request, queryset, ordering, per_page):
+    """Keyset page for the ?after= / ?before= cursor on the request. A
+    cursor that does not decode falls back to the first page."""
+    paginator = KeysetPaginator(queryset, ordering, per_page)
+    try:
+        return paginator.page(after=request.GET.get('after'), before=request.GET.get('before'))
+    except InvalidCursor:
+        return paginator.page()
@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from asgiref.sync import sync_to_async
+from botocore.config import Config
+from django.conf import settings
+from django.utils.http import content_disposition_header
+from storages.backends import s3 as s3_storage
+
+from .instrumentation import instrument_client
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_s3_client():
+    """The process-wide S3 client.
+
+    Building a client loads botocore's service model and opens a new
+    connection pool, so it is done once and shared. Clients are thread-safe.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = boto3.client('s3',
+                                       aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                                       aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                                       region_name=settings.AWS_S3_REGION_NAME,
+                                       config=Config(
+                                           signature_version='s3v4',
+                                           max_pool_connections=settings.AWS_S3_MAX_POOL_CONNECTIONS,
+                                           tcp_keepalive=True,
+                                           retries={'max_attempts': 3, 'mode': 'standard'},
+                                       ))
+                instrument_client(_client)
+    return _client
+
+
+class S3Storage(s3_storage.S3Storage):
+    """django-storages' S3Storage with its API calls timed like the shared
+    client's. It keeps one connection per thread, so each is instrumented
+    as it is made."""
+
+    @property
+    def connection(self):
+        new = getattr(self._connections, 'connection', None) is None
+        connection = super().connection
+        if new:
+            instrument_client(connection.meta.client)
+        return connection
+
+
+def reset_s3_client():
+    global _client
+    with _client_lock:
+        _client = None
+    presigned_urls.clear()
+
+
+class PresignedURLCache:
+    """LRU of presigned GET URLs keyed by (bucket, key, filename).
+
+    Blob keys are content hashes, so ``filename`` is sent back as the
+    response's Content-Disposition for the browser to name the file by.
+
+    A URL is handed out again until ``margin`` seconds before it expires, so
+    a page never links to something that stops working while it is open.
+    """
+
+    def __init__(self, max_size, expires_in, margin):
+        self.max_size = max_size
+        self.expires_in = expires_in
+        self.margin = margin
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, bucket_name, key, filename=None):
+        now = time.monotonic()
+        entry_key = (bucket_name, key, filename)
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is not None:
+                url, expires_at = entry
+                if expires_at - self.margin > now:
+                    self._entries.move_to_end(entry_key)
+                    return url
+                del self._entries[entry_key]
+
+        params = {'Bucket': bucket_name, 'Key': key}
+        if filename:
+            params['ResponseContentDisposition'] = content_disposition_header(False, filename)
+        url = get_s3_client().generate_presigned_url('get_object', Params=params, ExpiresIn=self.expires_in)
+        with self._lock:
+            self._entries[entry_key] = (url, now + self.expires_in)
+            self._entries.move_to_end(entry_key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return url
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+presigned_urls = PresignedURLCache(
+    max_size=settings.PRESIGNED_URL_CACHE_SIZE,
+    expires_in=settings.PRESIGNED_URL_EXPIRES,
+    margin=settings.PRESIGNED_URL_REFRESH_MARGIN,
+)
+
+
+def presigned_url(bucket_name, key, filename=None):
+    return presigned_urls.get(bucket_name, key, filename)
+
+
+# Async views hand blocking S3 work to this pool. It is no larger than the
+# client's connection pool, so a slow S3 queues calls here rather than
+# piling up threads that would only wait for a connection.
+s3_executor = ThreadPoolExecutor(
+    max_workers=settings.AWS_S3_MAX_POOL_CONNECTIONS,
+    thread_name_prefix='s3',
+)
+
+
+def run_in_s3_pool(func):
+    """``func`` as a coroutine function running on the S3 pool. ``func``
+    must not touch the database; those threads have no managed connection."""
+    return sync_to_async(func, thread_sensitive=False, executor=s3_executor)
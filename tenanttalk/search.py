@@ -0,0 +1,70 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+
+from .models import Report
+
+
+SEARCH_CONFIG = 'english'
+SEARCH_FIELDS = ('post_title', 'building_address', 'landlord_name', 'report')
+
+# SQLite mirror of SEARCH_FIELDS, kept in step by triggers (migration 0006)
+FTS_TABLE = 'tenanttalk_report_fts'
+
+
+def search_vector():
+    # Must stay identical to the expression in Report.Meta.indexes so
+    # Postgres can answer the match from the GIN index
+    return SearchVector(*SEARCH_FIELDS, config=SEARCH_CONFIG)
+
+
+def search_reports(query, page=1, per_page=10):
+    """Resolved reports matching ``query``, best match first.
+
+    Returns (reports, has_next) for the given 1-based page.
+    """
+    offset = (page - 1) * per_page
+    if connection.vendor == 'postgresql':
+        reports = _search_postgres(query, offset, per_page + 1)
+    else:
+        reports = _search_sqlite(query, offset, per_page + 1)
+    return reports[:per_page], len(reports) > per_page
+
+
+def _search_postgres(query, offset, limit):
+    search_query = SearchQuery(query, search_type='websearch', config=SEARCH_CONFIG)
+    queryset = (
+        Report.objects.filter(status='RESOLVED')
+        .annotate(search=search_vector())
+        .filter(search=search_query)
+        .annotate(rank=SearchRank(search_vector(), search_query))
+        .order_by('-rank', '-id')
+    )
+    return list(queryset[offset:offset + limit])
+
+
+def _fts_match(query):
+    # Every word must appear, each as a prefix; quoting keeps user input
+    # from being read as FTS5 syntax
+    words = re.findall(r'\w+', query)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _search_sqlite(query, offset, limit):
+    match = _fts_match(query)
+    if not match:
+        return []
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT report.id FROM {FTS_TABLE} '
+            f'JOIN tenanttalk_report AS report ON report.id = {FTS_TABLE}.rowid '
+            f"WHERE {FTS_TABLE} MATCH %s AND report.status = 'RESOLVED' "
+            f'ORDER BY bm25({FTS_TABLE}), report.id DESC LIMIT %s OFFSET %s',
+            [match, limit, offset],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+
+    reports = Report.objects.in_bulk(ids)
+    return [reports[report_id] for report_id in ids if report_id in reports]
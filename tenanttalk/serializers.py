@@ -0,0 +1,47 @@
+from rest_framework import serializers
+
+from .models import Report
+from .moderation import MODERATION_ACTIONS
+
+
+class BulkModerationSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=1000,
+    )
+    action = serializers.ChoiceField(choices=[*MODERATION_ACTIONS, 'feedback'])
+    feedback = serializers.CharField(max_length=200, required=False, allow_blank=False)
+
+    def validate(self, data):
+        if data['action'] == 'feedback' and not data.get('feedback'):
+            raise serializers.ValidationError({'feedback': 'Feedback text is required for this action.'})
+        # Keep the order given but act on each report once
+        data['ids'] = list(dict.fromkeys(data['ids']))
+        return data
+
+
+class ReportSerializer(serializers.ModelSerializer):
+    """A resolved report as the public sees it. Pass ``fields`` to return
+    only some of the fields."""
+
+    verified = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Report
+        fields = [
+            'id', 'post_title', 'building_address', 'landlord_name', 'report',
+            'time_stamp', 'verified', 'landlord', 'building',
+        ]
+
+    # Model column behind each field, for QuerySet.only()
+    SOURCES = {'verified': 'verify'}
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def get_verified(self, report):
+        return report.verify == 'T'
@@ -0,0 +1,60 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .feed_cache import invalidate_feed
+from .models import Building, Landlord, Report
+
+
+def contribution(status, verify):
+    return {
+        "resolved": int(status == "RESOLVED"),
+        "verified": int(verify == "T"),
+    }
+
+
+def update_stats(model, report, created):
+    field = f"{model.report_field}_id"
+    current = getattr(report, field)
+    previous = report.loaded(field)
+
+    if created:
+        if current is not None:
+            model.bump(current, reports=1, time_stamp=report.time_stamp,
+                       **contribution(report.status, report.verify))
+    elif not hasattr(report, "loaded_state") or previous != current:
+        # Moved to another landlord/building, or saved without having been
+        # loaded first: count both sides again rather than guess
+        model.recount(previous, current)
+    elif current is not None:
+        before = contribution(report.loaded("status"), report.loaded("verify"))
+        after = contribution(report.status, report.verify)
+        deltas = {key: after[key] - before[key] for key in after}
+        # Feedback edits and plain re-saves change no counter; skip the
+        # write (and the row lock on a busy landlord)
+        if any(deltas.values()):
+            model.bump(current, time_stamp=report.time_stamp, **deltas)
+
+
+@receiver(post_save, sender=Report)
+def report_saved(sender, instance, created, **kwargs):
+    # Only moderation changes what the public feed shows; feedback edits and
+    # plain re-saves leave the cached pages alone
+    if created:
+        changed = instance.status == "RESOLVED"
+    else:
+        changed = instance.moderation_state != instance.loaded_moderation_state
+
+    update_stats(Landlord, instance, created)
+    update_stats(Building, instance, created)
+
+    instance.remember_state()
+    if changed:
+        invalidate_feed()
+
+
+@receiver(post_delete, sender=Report)
+def report_deleted(sender, instance, **kwargs):
+    Landlord.recount(instance.landlord_id)
+    Building.recount(instance.building_id)
+    if instance.status == "RESOLVED":
+        invalidate_feed()
@@ -0,0 +1,66 @@
+import os
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+
+class StaticFilesStorage(CompressedManifestStaticFilesStorage):
+    """Hashed filenames in a manifest plus pre-compressed Brotli/gzip copies,
+    served by WhiteNoise with far-future cache headers.
+
+    With STATICFILES_SKIP_UNCHANGED, collectstatic only compresses files that
+    changed since the last run; Brotli at full strength is most of its time.
+    """
+
+    def compress_files(self, paths):
+        if settings.STATICFILES_SKIP_UNCHANGED:
+            hashed = set(self.hashed_files.values())
+            paths = [path for path in paths if not self.compressed_copies_current(path, path in hashed)]
+        return super().compress_files(paths)
+
+    def compressed_copies_current(self, path, hashed):
+        full_path = self.path(path)
+        copies = [full_path + suffix for suffix in ('.br', '.gz') if os.path.exists(full_path + suffix)]
+        if not copies:
+            return False
+        if hashed:
+            # The name changes with the content, so any copy is current
+            return True
+        # WhiteNoise gives the copies their source's modification time
+        mtime = os.stat(full_path).st_mtime
+        return all(os.stat(copy).st_mtime == mtime for copy in copies)
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise's middleware, made async capable.
+
+    The stock one is sync only, and a single sync middleware pins every
+    request to one thread under ASGI, so the async views stop overlapping.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        # Looking up a collected file is a dict access unless autorefresh
+        # (DEBUG) rescans the directories on every request
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
@@ -1,14 +1,58 @@
-from django.test import Client, TestCase, RequestFactory
+from django.test import Client, TestCase, RequestFactory, override_settings
 from django.urls import reverse
 from django.contrib.auth.models import User
 from . import views
 from .urls import urlpatterns
 from django.utils import timezone
-from .models import Report
-from unittest.mock import patch
+from .models import Report, Attachment, Landlord, Building, report_content_hash
+from unittest.mock import patch, MagicMock
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
+from .attachments import backfill_attachments
+from .file_store import get_file_store
+from .uploads import MeteredUpload, UploadTooLarge
+from . import s3 as s3_module
+from . import uploads as uploads_module
+from moto import mock_aws
+import requests
 import tempfile
+import os
+import threading
+import hashlib
+from datetime import datetime, timedelta, timezone as dt_timezone
 from .forms import UserRegistrationForm, UserLoginForm
 from django.contrib.auth import get_user_model
+from django.contrib.sites.models import Site
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from .pagination import KeysetPaginator
+from .feed_cache import feed_version
+from .moderation import bulk_moderate
+from .search import search_reports
+from . import bulk, listing, thumbnails
+from .instrumentation import RequestTimings, current as current_timings, histograms
+from django.core.files.base import ContentFile
+from django.http import FileResponse
+from io import BytesIO
+from PIL import Image
+from django.core.management import call_command
+from io import StringIO
+import json
+import csv
+import asyncio
+import warnings
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core import signals
+from django.core.handlers.asgi import ASGIHandler
+from django.db import close_old_connections
+import time
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from boto3.s3.transfer import TransferConfig
+from contextlib import ContextDecorator
 
 
 # from django.test import override_settings
@@ -233,3 +277,1826 @@ class UserRegistrationFormTestCase(TestCase):
         user = form.save()
         self.assertIsInstance(user, User)
         
+
+
+class AttachmentManifestTestCase(TestCase):
+    def setUp(self):
+        self.staff_user = User.objects.create_user(
+            username='staffuser',
+            email='staffuser@example.com',
+            password='testpassword',
+            is_staff=True
+        )
+        self.regular_user = User.objects.create_user(
+            username='regularuser',
+            email='regularuser@example.com',
+            password='testpassword'
+        )
+        stamp = datetime(2024, 4, 1, 12, 30, tzinfo=dt_timezone.utc)
+        self.first = Report.objects.create(
+            post_title="Leak", building_address="1 Main St", landlord_name="Jane",
+            report="Water leak", time_stamp=stamp, user="alice"
+        )
+        self.second = Report.objects.create(
+            post_title="Mold", building_address="2 Main St", landlord_name="Jane",
+            report="Mold in bathroom", time_stamp=stamp, user="bob"
+        )
+
+    def submit_report(self, title, body='Broken heater', **files):
+        data = {
+            'post_title': title,
+            'building_address': '3 Main St',
+            'landlord_name': 'Jane',
+            'report': body,
+        }
+        data.update(files)
+        return self.client.post(reverse('report'), data)
+
+    def test_report_records_attachments(self):
+        self.client.login(username='regularuser', password='testpassword')
+        self.submit_report(
+            'Heater',
+            pdf=SimpleUploadedFile('lease.pdf', b'%PDF-1.4 lease', content_type='application/pdf'),
+            txt=SimpleUploadedFile('notes.txt', b'no heat', content_type='text/plain'),
+        )
+
+        report = Report.objects.get(post_title='Heater')
+        attachments = {a.name: a for a in report.attachments.all()}
+        self.assertEqual(set(attachments), {'lease.pdf', 'notes.txt'})
+        self.assertEqual(attachments['lease.pdf'].key, f"blobs/{hashlib.sha256(b'%PDF-1.4 lease').hexdigest()}")
+        self.assertEqual(attachments['notes.txt'].size, 7)
+        self.assertEqual(attachments['notes.txt'].checksum, hashlib.sha256(b'no heat').hexdigest())
+
+    def test_same_title_and_minute_do_not_collide(self):
+        self.client.login(username='regularuser', password='testpassword')
+        self.submit_report('Heater', txt=SimpleUploadedFile('notes.txt', b'first'))
+        self.submit_report('Heater', body='Still broken', txt=SimpleUploadedFile('notes.txt', b'second'))
+
+        keys = list(Attachment.objects.filter(report__post_title__startswith='Heater').values_list('key', flat=True))
+        self.assertEqual(len(set(keys)), 2)
+
+    def test_view_report_reads_manifest(self):
+        Attachment.objects.create(report=self.first, key='uploads/alice/1/lease.pdf', size=10)
+        self.client.login(username='staffuser', password='testpassword')
+
+        with patch('tenanttalk.file_store.presigned_url', return_value='https://s3/signed'), \
+                patch('tenanttalk.listing.get_s3_client') as client:
+            response = self.client.get(reverse('view_report', args=[self.first.id]))
+
+        self.assertEqual(response.status_code, 200)
+        client.assert_not_called()
+        self.assertEqual([f['name'] for f in response.context['files']], ['lease.pdf'])
+
+    def test_backfill_matches_legacy_folders(self):
+        contents = {
+            'uploads/alice/': [{'Key': 'uploads/alice/Leak-20240401-1230/lease.pdf', 'Size': 9}],
+            'uploads/bob/': [{'Key': 'uploads/bob/Mold-20240401-1230/photo.jpg', 'Size': 5}],
+        }
+        s3 = MagicMock()
+        s3.list_objects_v2.side_effect = lambda **params: (
+            {'CommonPrefixes': [{'Prefix': prefix} for prefix in contents]}
+            if params.get('Delimiter') else {'Contents': contents[params['Prefix']]}
+        )
+        with patch('tenanttalk.listing.get_s3_client', return_value=s3):
+            self.assertEqual(backfill_attachments([self.first, self.second]), 2)
+            self.assertEqual(backfill_attachments([self.first, self.second]), 0)
+
+        lease = Attachment.objects.get(report=self.first)
+        self.assertEqual(lease.size, 9)
+        self.assertEqual(lease.content_type, 'application/pdf')
+
+
+class StreamingUploadTestCase(TestCase):
+    def setUp(self):
+        self.regular_user = User.objects.create_user(
+            username='regularuser',
+            email='regularuser@example.com',
+            password='testpassword'
+        )
+        self.client.login(username='regularuser', password='testpassword')
+
+    def submit_report(self, **files):
+        data = {
+            'post_title': 'Heater',
+            'building_address': '3 Main St',
+            'landlord_name': 'Jane',
+            'report': 'Broken heater',
+        }
+        data.update(files)
+        return self.client.post(reverse('report'), data)
+
+    @override_settings(REPORT_UPLOAD_MAX_SIZE=16)
+    def test_oversized_upload_rejected_before_report_saved(self):
+        response = self.submit_report(txt=SimpleUploadedFile('notes.txt', b'x' * 17))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Report.objects.exists())
+
+    def test_wrong_pdf_type_rejected_before_report_saved(self):
+        self.submit_report(pdf=SimpleUploadedFile('lease.pdf', b'hello', content_type='text/plain'))
+
+        self.assertFalse(Report.objects.exists())
+
+    def test_metered_upload_counts_while_reading(self):
+        upload = MeteredUpload(SimpleUploadedFile('notes.txt', b'abc' * 1000), max_size=3000)
+        for _ in upload.chunks(chunk_size=64):
+            pass
+
+        self.assertEqual(upload.bytes_read, 3000)
+
+    def test_metered_upload_stops_past_limit(self):
+        upload = MeteredUpload(SimpleUploadedFile('notes.txt', b'x' * 100), max_size=50)
+
+        with self.assertRaises(UploadTooLarge):
+            for _ in upload.chunks(chunk_size=32):
+                pass
+
+    def test_attachments_written_concurrently(self):
+        # Each save only gets past the barrier once all three are in flight
+        barrier = threading.Barrier(3, timeout=5)
+        original_save = default_storage.save
+
+        def save(name, content):
+            barrier.wait()
+            return original_save(name, content)
+
+        with patch('tenanttalk.uploads.default_storage.save', side_effect=save):
+            self.submit_report(
+                pdf=SimpleUploadedFile('lease.pdf', b'%PDF-1.4 concurrent', content_type='application/pdf'),
+                txt=SimpleUploadedFile('notes.txt', b'concurrent', content_type='text/plain'),
+                jpg=SimpleUploadedFile('photo.jpg', b'concurrent jpeg', content_type='image/jpeg'),
+            )
+
+        report = Report.objects.get()
+        self.assertEqual(sorted(a.name for a in report.attachments.all()), ['lease.pdf', 'notes.txt', 'photo.jpg'])
+
+
+class SharedS3ClientTestCase(TestCase):
+    def setUp(self):
+        s3_module.reset_s3_client()
+        self.addCleanup(s3_module.reset_s3_client)
+
+    def test_client_built_once_across_threads(self):
+        clients = []
+        with patch('tenanttalk.s3.boto3.client', side_effect=lambda *args, **kwargs: MagicMock()) as factory:
+            threads = [threading.Thread(target=lambda: clients.append(s3_module.get_s3_client())) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(factory.call_count, 1)
+        self.assertEqual(len({id(client) for client in clients}), 1)
+
+    def test_presigned_url_reused_until_refresh_margin(self):
+        client = MagicMock()
+        client.generate_presigned_url.side_effect = lambda *args, **kwargs: f'https://s3/{client.generate_presigned_url.call_count}'
+        cache = s3_module.PresignedURLCache(max_size=10, expires_in=3600, margin=300)
+
+        with patch('tenanttalk.s3.get_s3_client', return_value=client), \
+                patch('tenanttalk.s3.time.monotonic', return_value=1000):
+            self.assertEqual(cache.get('bucket', 'a.pdf'), 'https://s3/1')
+            self.assertEqual(cache.get('bucket', 'a.pdf'), 'https://s3/1')
+        with patch('tenanttalk.s3.get_s3_client', return_value=client), \
+                patch('tenanttalk.s3.time.monotonic', return_value=1000 + 3600 - 299):
+            self.assertEqual(cache.get('bucket', 'a.pdf'), 'https://s3/2')
+
+    def test_presigned_url_names_the_file(self):
+        client = MagicMock()
+        cache = s3_module.PresignedURLCache(max_size=10, expires_in=3600, margin=300)
+
+        with patch('tenanttalk.s3.get_s3_client', return_value=client):
+            cache.get('bucket', 'blobs/abc', 'lease.pdf')
+            cache.get('bucket', 'blobs/abc', 'lease copy.pdf')
+
+        self.assertEqual(client.generate_presigned_url.call_count, 2)
+        self.assertEqual(client.generate_presigned_url.call_args.kwargs['Params'], {
+            'Bucket': 'bucket', 'Key': 'blobs/abc',
+            'ResponseContentDisposition': 'inline; filename="lease copy.pdf"',
+        })
+
+    def test_least_recently_used_url_is_evicted(self):
+        client = MagicMock()
+        cache = s3_module.PresignedURLCache(max_size=2, expires_in=3600, margin=300)
+
+        with patch('tenanttalk.s3.get_s3_client', return_value=client):
+            cache.get('bucket', 'a')
+            cache.get('bucket', 'b')
+            cache.get('bucket', 'a')
+            cache.get('bucket', 'c')
+            self.assertEqual(len(cache), 2)
+            cache.get('bucket', 'a')
+            self.assertEqual(client.generate_presigned_url.call_count, 3)
+
+
+@override_settings(
+    AWS_STORAGE_BUCKET_NAME='tenanttalk-test',
+    AWS_S3_REGION_NAME='us-east-1',
+    AWS_ACCESS_KEY_ID='testing',
+    AWS_SECRET_ACCESS_KEY='testing',
+    REPORT_DIRECT_UPLOADS=True,
+)
+class DirectUploadTestCase(TestCase):
+    def setUp(self):
+        mock = mock_aws()
+        mock.start()
+        self.addCleanup(mock.stop)
+        s3_module.reset_s3_client()
+        self.addCleanup(s3_module.reset_s3_client)
+        self.s3 = s3_module.get_s3_client()
+        self.s3.create_bucket(Bucket='tenanttalk-test')
+
+        self.regular_user = User.objects.create_user(
+            username='regularuser',
+            email='regularuser@example.com',
+            password='testpassword'
+        )
+        self.client.login(username='regularuser', password='testpassword')
+        cache.clear()
+
+    def sign(self, field, filename, content_type):
+        return self.client.post(reverse('sign_upload'), {
+            'field': field,
+            'filename': filename,
+            'content_type': content_type,
+        })
+
+    def submit_report(self, **keys):
+        data = {
+            'post_title': 'Heater',
+            'building_address': '3 Main St',
+            'landlord_name': 'Jane',
+            'report': 'Broken heater',
+        }
+        data.update(keys)
+        return self.client.post(reverse('report'), data)
+
+    def test_browser_upload_recorded_on_submit(self):
+        upload = self.sign('pdf', 'lease.pdf', 'application/pdf').json()
+        sent = requests.post(upload['url'], data=upload['fields'],
+                             files={'file': ('lease.pdf', b'%PDF-1.4 lease')})
+        self.assertLess(sent.status_code, 300)
+
+        self.submit_report(pdf_key=upload['key'])
+
+        attachment = Attachment.objects.get()
+        self.assertEqual(attachment.key, upload['key'])
+        self.assertTrue(attachment.key.startswith('uploads/regularuser/direct/'))
+        self.assertEqual(attachment.size, 14)
+        self.assertEqual(attachment.content_type, 'application/pdf')
+
+    def test_wrong_content_type_is_not_signed(self):
+        response = self.sign('pdf', 'lease.pdf', 'text/plain')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_unsigned_key_is_ignored(self):
+        self.s3.put_object(Bucket='tenanttalk-test', Key='uploads/someoneelse/1/lease.pdf', Body=b'secret')
+
+        self.submit_report(pdf_key='uploads/someoneelse/1/lease.pdf')
+
+        self.assertTrue(Report.objects.exists())
+        self.assertFalse(Attachment.objects.exists())
+
+    def test_anonymous_cannot_sign(self):
+        self.client.logout()
+
+        response = self.sign('pdf', 'lease.pdf', 'application/pdf')
+
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(DIRECT_UPLOAD_HOURLY_LIMIT=2)
+    def test_signing_is_rate_limited(self):
+        statuses = [self.sign('pdf', 'lease.pdf', 'application/pdf').status_code for _ in range(3)]
+
+        self.assertEqual(statuses, [200, 200, 429])
+
+    def test_purge_deletes_only_unrecorded_direct_uploads(self):
+        recorded = self.sign('pdf', 'lease.pdf', 'application/pdf').json()['key']
+        orphan = self.sign('jpg', 'mold.jpg', 'image/jpeg').json()['key']
+        for key in (recorded, orphan, 'uploads/regularuser/1/old.pdf'):
+            self.s3.put_object(Bucket='tenanttalk-test', Key=key, Body=b'%PDF')
+        self.submit_report(pdf_key=recorded)
+
+        with patch('tenanttalk.uploads.timezone.now', return_value=timezone.now() + timedelta(hours=25)):
+            out = StringIO()
+            call_command('purge_direct_uploads', stdout=out)
+
+        keys = {obj['Key'] for obj in self.s3.list_objects_v2(Bucket='tenanttalk-test')['Contents']}
+        self.assertEqual(keys, {recorded, 'uploads/regularuser/1/old.pdf'})
+        self.assertIn('Deleted 1', out.getvalue())
+        # Anything newer than DIRECT_UPLOAD_ORPHAN_HOURS is left alone
+        self.assertEqual(uploads_module.purge_direct_uploads(), 0)
+
+    def test_purge_keeps_thumbnails_of_recorded_uploads(self):
+        recorded = self.sign('jpg', 'mold.jpg', 'image/jpeg').json()['key']
+        self.s3.put_object(Bucket='tenanttalk-test', Key=recorded, Body=b'jpeg')
+        self.submit_report(jpg_key=recorded)
+        thumbnail = thumbnails.thumbnail_key(recorded)
+        self.s3.put_object(Bucket='tenanttalk-test', Key=thumbnail, Body=b'webp')
+        Attachment.objects.filter(key=recorded).update(thumbnail=thumbnail, thumbnailed_at=timezone.now())
+
+        self.assertEqual(uploads_module.purge_direct_uploads(hours=-1), 0)
+
+        keys = {obj['Key'] for obj in self.s3.list_objects_v2(Bucket='tenanttalk-test')['Contents']}
+        self.assertEqual(keys, {recorded, thumbnail})
+
+
+class ReportIndexTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        stamp = datetime(2024, 4, 1, 12, 30, tzinfo=dt_timezone.utc)
+        Report.objects.bulk_create([
+            Report(
+                post_title=f"Report {i}", building_address="1 Main St", landlord_name="Jane",
+                report="Water leak", time_stamp=stamp, user=f"user{i % 5}",
+                status=("NEW", "IN_PROGRESS", "RESOLVED")[i % 3], verify=("T", "F")[i % 2],
+            )
+            for i in range(60)
+        ])
+
+    def test_feed_query_uses_composite_index(self):
+        plan = Report.objects.filter(status='RESOLVED').order_by('-verify', '-time_stamp', '-id').explain()
+
+        self.assertIn('report_feed_keyset_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_user_reports_use_user_index(self):
+        plan = Report.objects.filter(user='user1').order_by('-time_stamp', '-id').explain()
+
+        self.assertIn('report_user_keyset_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_home_page_query_count(self):
+        # The current site and one keyset query for the page of reports
+        Site.objects.clear_cache()
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+
+
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        base = datetime(2024, 4, 1, 12, 30, tzinfo=dt_timezone.utc)
+        # Pairs of reports share a timestamp so the id has to break ties
+        Report.objects.bulk_create([
+            Report(
+                post_title=f"Report {i}", building_address="1 Main St", landlord_name="Jane",
+                report="Water leak", time_stamp=base + timedelta(hours=i // 2), user="alice",
+                status="RESOLVED", verify=("T", "F")[i % 3 == 0],
+            )
+            for i in range(11)
+        ])
+        self.expected = list(Report.objects.order_by('-verify', '-time_stamp', '-id'))
+
+    def test_walks_every_row_forward_and_back(self):
+        paginator = KeysetPaginator(Report.objects.all(), ('-verify', '-time_stamp', '-id'), per_page=3)
+
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(after=pages[-1].next_cursor))
+        self.assertEqual([r for page in pages for r in page], self.expected)
+        self.assertFalse(pages[0].has_previous())
+
+        back = [pages[-1]]
+        while back[-1].has_previous():
+            back.append(paginator.page(before=back[-1].previous_cursor))
+        self.assertEqual([list(page) for page in back[::-1]], [list(page) for page in pages])
+
+    def test_home_follows_cursor_without_count(self):
+        first = self.client.get(reverse('home')).context['items_page']
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(reverse('home'), {'after': first.next_cursor}).context['items_page']
+
+        self.assertEqual(list(second), self.expected[settings.REPORTS_PER_PAGE:2 * settings.REPORTS_PER_PAGE])
+        self.assertFalse(any('COUNT' in q['sql'] or 'OFFSET' in q['sql'] for q in queries.captured_queries))
+
+    def test_bad_cursor_shows_first_page(self):
+        response = self.client.get(reverse('home'), {'after': 'not-a-cursor'})
+
+        self.assertEqual(list(response.context['items_page']), self.expected[:settings.REPORTS_PER_PAGE])
+
+
+class DuplicateReportTestCase(TestCase):
+    def submit_report(self, title, body):
+        return self.client.post(reverse('report'), {
+            'post_title': title,
+            'building_address': '3 Main St',
+            'landlord_name': 'Jane',
+            'report': body,
+        })
+
+    def test_hash_stored_on_save(self):
+        report = Report.objects.create(
+            post_title="Leak", building_address="1 Main St", landlord_name="Jane",
+            report="Water leak", time_stamp=timezone.now(),
+        )
+
+        self.assertEqual(report.content_hash, report_content_hash("Leak", "1 Main St", "Jane", "Water leak"))
+
+    def test_near_duplicate_rejected(self):
+        self.submit_report('Broken Heater', 'No heat since  Monday')
+        response = self.submit_report('broken heater ', 'No heat since Monday')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Report.objects.count(), 1)
+
+    def test_different_report_accepted(self):
+        self.submit_report('Broken Heater', 'No heat since Monday')
+        self.submit_report('Broken Heater', 'No heat since Tuesday')
+
+        self.assertEqual(Report.objects.count(), 2)
+
+    def test_duplicate_check_uses_hash_index(self):
+        plan = Report.objects.filter(content_hash='0' * 64).explain()
+
+        self.assertIn('content_hash', plan)
+        self.assertIn('INDEX', plan)
+
+
+@override_settings(FEED_CACHE_ENABLED=True)
+class FeedCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff_user = User.objects.create_user(
+            username='staffuser',
+            email='staffuser@example.com',
+            password='testpassword',
+            is_staff=True
+        )
+        self.resolved = Report.objects.create(
+            post_title="Leak", building_address="1 Main St", landlord_name="Jane",
+            report="Water leak", time_stamp=timezone.now(), status="RESOLVED", verify="T",
+        )
+        self.pending = Report.objects.create(
+            post_title="Mold", building_address="2 Main St", landlord_name="Jane",
+            report="Mold in bathroom", time_stamp=timezone.now(), status="IN_PROGRESS",
+        )
+
+    def feed(self):
+        return list(self.client.get(reverse('home')).context['items_page'])
+
+    def test_repeat_visits_served_from_cache(self):
+        self.feed()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.feed()
+
+        self.assertFalse(any('tenanttalk_report' in q['sql'] for q in queries.captured_queries))
+
+    def test_resolving_a_report_refreshes_feed(self):
+        self.assertEqual(self.feed(), [self.resolved])
+
+        self.client.login(username='staffuser', password='testpassword')
+        self.client.post(reverse('view_report', args=[self.pending.id]), {'unresolve': 'Deny Verification'})
+
+        self.assertEqual(set(self.feed()), {self.resolved, self.pending})
+
+    def test_feedback_only_save_keeps_cache(self):
+        self.feed()
+        version = feed_version()
+
+        report = Report.objects.get(pk=self.resolved.pk)
+        report.feedback = "Thanks"
+        report.save()
+
+        self.assertEqual(feed_version(), version)
+
+    def test_invalid_cursors_share_first_page_entry(self):
+        self.feed()
+        keys = set(cache._cache)
+
+        for cursor in ('garbage', 'W10=', 'WyJUIl0='):
+            response = self.client.get(reverse('home'), {'after': cursor})
+            self.assertEqual(list(response.context['items_page']), [self.resolved])
+
+        self.assertEqual(set(cache._cache), keys)
+
+    @override_settings(FEED_CACHE_ENABLED=False)
+    def test_not_cached_when_disabled(self):
+        self.feed()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.feed()
+
+        self.assertTrue(any('tenanttalk_report' in q['sql'] for q in queries.captured_queries))
+
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        def make(title, address, landlord, body, status="RESOLVED"):
+            return Report.objects.create(
+                post_title=title, building_address=address, landlord_name=landlord,
+                report=body, time_stamp=timezone.now(), status=status,
+            )
+
+        self.heater = make("No heat", "12 Elm Street", "Acme Properties", "Heater broken all winter")
+        self.mold = make("Mold", "40 Oak Avenue", "Acme Properties", "Mold in the bathroom")
+        self.mice = make("Mice", "40 Oak Avenue", "Brick Rentals", "Mice in the kitchen and heater closet, heater again")
+        self.hidden = make("Heater", "12 Elm Street", "Acme Properties", "Heater broken", status="NEW")
+
+    def test_matches_landlord_address_and_body(self):
+        self.assertEqual(set(search_reports("acme")[0]), {self.heater, self.mold})
+        self.assertEqual(set(search_reports("oak avenue")[0]), {self.mold, self.mice})
+        self.assertEqual(search_reports("kitchen")[0], [self.mice])
+
+    def test_unresolved_reports_are_not_searchable(self):
+        self.assertNotIn(self.hidden, search_reports("heater")[0])
+
+    def test_results_are_ranked_and_paginated(self):
+        first, has_next = search_reports("heater", page=1, per_page=1)
+        second, has_more = search_reports("heater", page=2, per_page=1)
+
+        self.assertTrue(has_next)
+        self.assertFalse(has_more)
+        self.assertEqual(first, [self.mice])
+        self.assertEqual(second, [self.heater])
+
+    def test_index_follows_edits(self):
+        self.mold.report = "Black mold and a leaking roof"
+        self.mold.save()
+
+        self.assertEqual(search_reports("roof")[0], [self.mold])
+        self.assertEqual(search_reports("bathroom")[0], [])
+
+    def test_search_page(self):
+        response = self.client.get(reverse('search'), {'q': 'elm "street'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['results'], [self.heater])
+
+    @override_settings(SEARCH_MAX_PAGE=5)
+    def test_page_number_is_clamped(self):
+        for page, expected in (('99999999999999999999', 5), ('-3', 1), ('x', 1)):
+            response = self.client.get(reverse('search'), {'q': 'heater', 'page': page})
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['page'], expected)
+
+
+class LandlordBuildingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def make(self, landlord, address, status="NEW", verify="F"):
+        return Report.objects.create(
+            post_title="Report", building_address=address, landlord_name=landlord,
+            report=f"{landlord} at {address}", time_stamp=timezone.now(), status=status, verify=verify,
+        )
+
+    def test_spellings_share_one_entity(self):
+        first = self.make("Acme Properties, LLC", "12 Elm Street")
+        second = self.make("acme  properties", "12 elm st.")
+
+        self.assertEqual(first.landlord_id, second.landlord_id)
+        self.assertEqual(first.building_id, second.building_id)
+        self.assertEqual(first.landlord.name, "Acme Properties, LLC")
+        self.assertEqual(Landlord.objects.count(), 1)
+        self.assertEqual(Building.objects.count(), 1)
+
+    def test_counters_follow_moderation(self):
+        report = self.make("Acme", "12 Elm Street")
+        self.make("Acme", "40 Oak Avenue", status="RESOLVED")
+
+        report = Report.objects.get(pk=report.pk)
+        report.status = "RESOLVED"
+        report.verify = "T"
+        report.save()
+
+        landlord = Landlord.objects.get()
+        self.assertEqual((landlord.report_count, landlord.resolved_count, landlord.verified_count), (2, 2, 1))
+        self.assertEqual(landlord.latest_report_at, Report.objects.latest('time_stamp').time_stamp)
+
+        report.save()
+        landlord.refresh_from_db()
+        self.assertEqual((landlord.report_count, landlord.resolved_count, landlord.verified_count), (2, 2, 1))
+
+    def test_renamed_landlord_moves_counts(self):
+        report = self.make("Acme", "12 Elm Street", status="RESOLVED")
+
+        report = Report.objects.get(pk=report.pk)
+        report.landlord_name = "Brick Rentals"
+        report.save()
+
+        self.assertEqual(Landlord.objects.get(normalized="acme").report_count, 0)
+        self.assertEqual(Landlord.objects.get(normalized="brick rentals").resolved_count, 1)
+
+    def test_delete_recounts(self):
+        report = self.make("Acme", "12 Elm Street")
+        report.delete()
+
+        self.assertEqual(Building.objects.get().report_count, 0)
+
+    def test_expanding_names_fit_the_key(self):
+        # 30 characters, but casefold() turns each "ß" into "ss"
+        report = self.make("Straßenbahn Großgrundbesitz ß", "12 Elm Street")
+
+        landlord = Landlord.objects.get(pk=report.landlord_id)
+        self.assertLessEqual(len(landlord.normalized), Landlord._meta.get_field('normalized').max_length)
+        self.assertEqual(landlord.normalized, Landlord.normalize("Straßenbahn Großgrundbesitz ß"))
+
+    def test_feedback_edit_leaves_counters_alone(self):
+        report = Report.objects.get(pk=self.make("Acme", "12 Elm Street").pk)
+        report.feedback = "Thanks, looking into it"
+
+        with CaptureQueriesContext(connection) as queries:
+            report.save()
+
+        statements = [query['sql'] for query in queries]
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith('UPDATE "tenanttalk_report"'))
+
+    def test_profile_reads_counters(self):
+        for _ in range(3):
+            report = self.make("Acme", f"{_} Elm Street", status="RESOLVED")
+
+        Site.objects.clear_cache()
+        # The current site, the landlord row and one page of reports
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('landlord_profile', args=[report.landlord_id]))
+        self.assertEqual(response.context['profile'].resolved_count, 3)
+
+
+@override_settings(STAFF_QUEUE_PAGE_SIZE=2)
+class StaffQueueTestCase(TestCase):
+    def setUp(self):
+        self.staff_user = User.objects.create_user(
+            username='staffuser',
+            email='staffuser@example.com',
+            password='testpassword',
+            is_staff=True
+        )
+        self.regular_user = User.objects.create_user(
+            username='regularuser',
+            email='regularuser@example.com',
+            password='testpassword'
+        )
+        base = datetime(2024, 4, 1, 12, 30, tzinfo=dt_timezone.utc)
+        Report.objects.bulk_create([
+            Report(
+                post_title=f"Report {i}", building_address="1 Main St", landlord_name="Jane",
+                report="Water leak", time_stamp=base + timedelta(hours=i),
+                status=("NEW", "IN_PROGRESS", "RESOLVED")[i % 3],
+            )
+            for i in range(15)
+        ])
+        self.client.login(username='staffuser', password='testpassword')
+
+    def test_dashboard_shows_first_page_per_status(self):
+        response = self.client.get(reverse('myaccount'))
+
+        new, in_progress = response.context['queues']
+        self.assertEqual([r.post_title for r in new['page']], ["Report 0", "Report 3"])
+        self.assertEqual([r.post_title for r in in_progress['page']], ["Report 1", "Report 4"])
+        self.assertTrue(new['page'].has_next())
+
+    def test_load_more_walks_queue_oldest_first(self):
+        cursor = self.client.get(reverse('myaccount')).context['queues'][0]['page'].next_cursor
+        titles = []
+        while cursor:
+            page = self.client.get(reverse('staff_queue', args=['NEW']), {'after': cursor}).json()
+            titles += [r['post_title'] for r in page['reports']]
+            cursor = page['next_cursor']
+
+        self.assertEqual(titles, ["Report 6", "Report 9", "Report 12"])
+
+    def test_queue_uses_index(self):
+        plan = Report.objects.filter(status='NEW').order_by('time_stamp', 'id').explain()
+
+        self.assertIn('report_queue_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_queue_is_staff_only(self):
+        self.client.login(username='regularuser', password='testpassword')
+
+        response = self.client.get(reverse('staff_queue', args=['NEW']))
+
+        self.assertEqual(response.status_code, 403)
+
+
+class BulkModerationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff_user = User.objects.create_user(
+            username='staffuser',
+            email='staffuser@example.com',
+            password='testpassword',
+            is_staff=True
+        )
+        self.regular_user = User.objects.create_user(
+            username='regularuser',
+            email='regularuser@example.com',
+            password='testpassword'
+        )
+        self.reports = [
+            Report.objects.create(
+                post_title=f"Report {i}", building_address="1 Main St", landlord_name="Jane",
+                report=f"Water leak {i}", status=status, time_stamp=timezone.now(),
+            )
+            for i, status in enumerate(["NEW", "NEW", "IN_PROGRESS", "NEW"])
+        ]
+        self.ids = [report.id for report in self.reports]
+        self.client.login(username='staffuser', password='testpassword')
+
+    def moderate(self, **data):
+        return self.client.post(reverse('bulk_moderation'), data, content_type='application/json')
+
+    def test_resolve_updates_in_one_statement(self):
+        version = feed_version()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.moderate(ids=self.ids[:3] + [999999], action='resolve')
+        self.assertEqual(response.status_code, 200)
+
+        updates = [q for q in queries if q['sql'].startswith('UPDATE "tenanttalk_report"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(
+            [r['result'] for r in response.json()['results']],
+            ['updated', 'updated', 'updated', 'not_found'],
+        )
+        self.assertEqual(Report.objects.filter(status='RESOLVED', verify='T').count(), 3)
+        self.assertNotEqual(feed_version(), version)
+
+        landlord = Landlord.objects.get()
+        self.assertEqual((landlord.report_count, landlord.resolved_count, landlord.verified_count), (4, 3, 3))
+
+    def test_in_progress_skips_reports_already_moving(self):
+        response = self.moderate(ids=self.ids, action='in_progress')
+
+        self.assertEqual(
+            [r['result'] for r in response.json()['results']],
+            ['updated', 'updated', 'unchanged', 'updated'],
+        )
+        self.assertFalse(Report.objects.filter(status='NEW').exists())
+
+    def test_feedback_requires_text(self):
+        response = self.moderate(ids=self.ids, action='feedback')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('feedback', response.json())
+
+        self.moderate(ids=self.ids[:1], action='feedback', feedback='Please add photos')
+        report = Report.objects.get(pk=self.ids[0])
+        self.assertEqual((report.feedback, report.status), ('Please add photos', 'IN_PROGRESS'))
+
+    def test_staff_only(self):
+        self.client.login(username='regularuser', password='testpassword')
+
+        response = self.moderate(ids=self.ids, action='resolve')
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Report.objects.filter(status='RESOLVED').exists())
+
+
+@override_settings(API_REPORTS_PER_PAGE=2)
+class ReportAPITestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        base = datetime(2024, 4, 1, 12, 30, tzinfo=dt_timezone.utc)
+        Report.objects.bulk_create([
+            Report(
+                post_title=f"Report {i}", building_address="1 Main St", landlord_name="Jane",
+                report="Water leak", time_stamp=base + timedelta(hours=i),
+                status="NEW" if i == 4 else "RESOLVED", user="someone",
+                updated_at=base + timedelta(hours=i),
+            )
+            for i in range(5)
+        ])
+
+    def test_list_walks_resolved_reports_newest_first(self):
+        titles = []
+        url = reverse('api_reports')
+        while url:
+            page = self.client.get(url).json()
+            titles += [r['post_title'] for r in page['results']]
+            url = page['next']
+
+        self.assertEqual(titles, ["Report 3", "Report 2", "Report 1", "Report 0"])
+
+    def test_sparse_fieldsets(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('api_reports'), {'fields': 'id,post_title'})
+
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'post_title'})
+        self.assertNotIn('"report"', queries[-1]['sql'])
+        self.assertEqual(self.client.get(reverse('api_reports'), {'fields': 'user'}).status_code, 400)
+
+    def test_conditional_get(self):
+        response = self.client.get(reverse('api_reports'))
+        self.assertEqual(response['Last-Modified'], 'Mon, 01 Apr 2024 15:30:00 GMT')
+
+        response = self.client.get(reverse('api_reports'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_moderation_changes_etag(self):
+        etag = self.client.get(reverse('api_reports'))['ETag']
+
+        report = Report.objects.get(post_title="Report 4")
+        report.status = "RESOLVED"
+        report.save()
+
+        response = self.client.get(reverse('api_reports'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['post_title'], "Report 4")
+
+    def test_verification_moves_last_modified(self):
+        last_modified = self.client.get(reverse('api_reports'))['Last-Modified']
+
+        report = Report.objects.get(post_title="Report 0")
+        report.verify = "T"
+        report.save()
+
+        response = self.client.get(reverse('api_reports'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+
+    def test_bulk_moderation_and_deletes_change_validators(self):
+        first = self.client.get(reverse('api_reports'))
+
+        bulk_moderate([Report.objects.get(post_title="Report 1").pk], 'resolve')
+        second = self.client.get(reverse('api_reports'), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['Last-Modified'], first['Last-Modified'])
+
+        Report.objects.get(post_title="Report 0").delete()
+        third = self.client.get(reverse('api_reports'), HTTP_IF_NONE_MATCH=second['ETag'])
+        self.assertEqual(third.status_code, 200)
+
+    def test_feedback_edit_keeps_validators(self):
+        # bulk_create skipped save(), so give the fixture its content hash first
+        report = Report.objects.get(post_title="Report 2")
+        report.save()
+        etag = self.client.get(reverse('api_reports'))['ETag']
+
+        report = Report.objects.get(pk=report.pk)
+        report.feedback = "Fixed"
+        report.save()
+
+        self.assertEqual(self.client.get(reverse('api_reports'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_detail_hides_unresolved_reports(self):
+        report = Report.objects.get(post_title="Report 4")
+
+        self.assertEqual(self.client.get(reverse('api_report', args=[report.pk])).status_code, 404)
+
+
+class BulkImportExportTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.existing = Report.objects.create(
+            post_title="Mold", building_address="1 Main Street", landlord_name="Jane LLC",
+            report="Mold in the bathroom", time_stamp=timezone.now(), status="RESOLVED",
+        )
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, content):
+        path = f"{self.tmp.name}/{name}"
+        with open(path, 'w', newline='') as f:
+            f.write(content)
+        return path
+
+    def test_import_csv_dedups_and_links(self):
+        path = self.write('reports.csv', (
+            "post_title,building_address,landlord_name,report,time_stamp,status,verify\n"
+            "MOLD,1 Main  Street,jane llc,Mold in  the bathroom,2024-04-01T12:00:00+00:00,RESOLVED,T\n"
+            "Heat,1 Main St.,Jane,No heat,2024-04-02T12:00:00+00:00,RESOLVED,T\n"
+            "Heat,1 Main St.,Jane,No heat,2024-04-02T12:00:00+00:00,RESOLVED,T\n"
+            "Leak,9 Elm Ave,Bob,Leaky pipe,,NEW,F\n"
+            ",9 Elm Ave,Bob,No title,,NEW,F\n"
+            f"Noise,9 Elm Ave,{'B' * 31},Loud,,NEW,F\n"
+        ))
+        out, err = StringIO(), StringIO()
+
+        call_command('import_reports', path, batch_size=2, stdout=out, stderr=err)
+
+        self.assertIn("Imported 2 report(s), skipped 2 duplicate(s) and 2 bad row(s)", out.getvalue())
+        self.assertIn("Row 5 skipped: missing post_title", err.getvalue())
+        self.assertIn("Row 6 skipped: too long: landlord_name", err.getvalue())
+        heat = Report.objects.get(post_title="Heat")
+        self.assertEqual(heat.content_hash, report_content_hash("Heat", "1 Main St.", "Jane", "No heat"))
+        self.assertEqual(heat.landlord_id, self.existing.landlord_id)
+        self.assertEqual(heat.building_id, self.existing.building_id)
+        landlord = heat.landlord
+        self.assertEqual((landlord.report_count, landlord.resolved_count, landlord.verified_count), (2, 2, 1))
+        self.assertEqual(Landlord.objects.count(), 2)
+
+    def test_import_jsonl_reports_malformed_rows(self):
+        path = self.write('reports.jsonl', (
+            '[1, 2]\n'
+            '{"post_title": "Heat", "building_address": 12, "landlord_name": "Jane", "report": "No heat"}\n'
+            '"Leak"\n'
+            '{"post_title": "Leak", "building_address": "9 Elm Ave", "landlord_name": "Bob", "report": "Leaky pipe"}\n'
+        ))
+        out, err = StringIO(), StringIO()
+
+        call_command('import_reports', path, stdout=out, stderr=err)
+
+        self.assertIn("Imported 1 report(s), skipped 0 duplicate(s) and 3 bad row(s)", out.getvalue())
+        self.assertIn("Row 1 skipped: not an object: list", err.getvalue())
+        self.assertIn("Row 2 skipped: not text: building_address", err.getvalue())
+        self.assertIn("Row 3 skipped: not an object: str", err.getvalue())
+        self.assertTrue(Report.objects.filter(post_title="Leak").exists())
+
+    def test_import_batch_queries_do_not_grow_with_rows(self):
+        rows = [
+            {"post_title": f"Report {i}", "building_address": f"{i} Main St", "landlord_name": "Jane",
+             "report": "Water leak"}
+            for i in range(50)
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            list(bulk.import_rows(iter(rows), batch_size=50))
+
+        self.assertEqual(Report.objects.count(), 51)
+        self.assertLess(len(queries), 15)
+
+    def test_export_round_trips_through_jsonl(self):
+        path = f"{self.tmp.name}/reports.jsonl"
+        call_command('export_reports', path, stderr=StringIO())
+        with open(path) as f:
+            exported = [json.loads(line) for line in f]
+        self.assertEqual(exported[0]['post_title'], "Mold")
+        self.assertEqual(exported[0]['status'], "RESOLVED")
+
+        self.existing.delete()
+        call_command('import_reports', path, stdout=StringIO(), stderr=StringIO())
+
+        report = Report.objects.get()
+        self.assertEqual((report.report, report.status, report.time_stamp),
+                         ("Mold in the bathroom", "RESOLVED", self.existing.time_stamp))
+
+
+async def collect(content):
+    return [part async for part in content]
+
+
+class StaffExportTestCase(TestCase):
+    def setUp(self):
+        self.staff_user = User.objects.create_user(
+            username='staffuser',
+            email='staffuser@example.com',
+            password='testpassword',
+            is_staff=True
+        )
+        self.regular_user = User.objects.create_user(
+            username='regularuser',
+            email='regularuser@example.com',
+            password='testpassword'
+        )
+        for i, (landlord, day) in enumerate([("Jane LLC", 1), ("jane", 2), ("Bob", 2), ("Jane", 5)]):
+            Report.objects.create(
+                post_title=f"Report {i}", building_address="1 Main St", landlord_name=landlord,
+                report=f"Water leak {i}", time_stamp=datetime(2024, 4, day, 12, tzinfo=dt_timezone.utc),
+                status="RESOLVED" if i else "NEW",
+            )
+        self.client.login(username='staffuser', password='testpassword')
+
+    def export(self, **params):
+        response = self.client.get(reverse('export_reports'), params)
+        self.assertTrue(response.streaming)
+        self.assertTrue(response.is_async)
+        lines = async_to_sync(collect)(response.streaming_content)
+        rows = list(csv.DictReader(line.decode() for line in lines))
+        return [row['post_title'] for row in rows]
+
+    async def test_streams_under_asgi(self):
+        for i in range(50):
+            await Report.objects.acreate(
+                post_title=f"Bulk {i}", building_address="1 Main St", landlord_name="Jane",
+                report=f"Water leak {i}", time_stamp=timezone.now(),
+            )
+        await self.async_client.aforce_login(self.staff_user)
+        session = self.async_client.cookies[settings.SESSION_COOKIE_NAME].value
+
+        # Rows pulled from the database by the time each body chunk went out
+        read = []
+        pulled = []
+        real_rows = bulk.aexport_rows
+
+        async def counted_rows(queryset):
+            async for row in real_rows(queryset):
+                read.append(row)
+                yield row
+
+        requests_body = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+        async def receive():
+            if requests_body:
+                return requests_body.pop()
+            # The client never disconnects
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message['type'] == 'http.response.body' and message.get('body'):
+                pulled.append(len(read))
+            elif message['type'] == 'http.response.start':
+                self.assertEqual(message['status'], 200)
+
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': reverse('export_reports'), 'raw_path': reverse('export_reports').encode(),
+            'query_string': b'', 'root_path': '', 'server': ('testserver', 80), 'client': ('127.0.0.1', 1),
+            'headers': [(b'host', b'testserver'), (b'cookie', f'{settings.SESSION_COOKIE_NAME}={session}'.encode())],
+        }
+        # As AsyncClient does: keep the test's connection (and its transaction) open
+        signals.request_started.disconnect(close_old_connections)
+        signals.request_finished.disconnect(close_old_connections)
+        try:
+            with patch('tenanttalk.views.aexport_rows', counted_rows), warnings.catch_warnings():
+                warnings.simplefilter('error')
+                await ASGIHandler()(scope, receive, send)
+        finally:
+            signals.request_started.connect(close_old_connections)
+            signals.request_finished.connect(close_old_connections)
+
+        self.assertEqual(len(read), 54)
+        # The header line went out before a single row was read, and each
+        # row after the one before it
+        self.assertEqual(pulled[:3], [0, 1, 2])
+        self.assertEqual(len(pulled), 55)
+
+    def test_filters(self):
+        self.assertEqual(self.export(), ["Report 0", "Report 1", "Report 2", "Report 3"])
+        self.assertEqual(self.export(landlord="JANE"), ["Report 0", "Report 1", "Report 3"])
+        self.assertEqual(self.export(landlord="jane", status="RESOLVED", **{'from': '2024-04-02', 'to': '2024-04-04'}),
+                         ["Report 1"])
+        self.assertEqual(self.export(address="1 main street", to="2024-04-01"), ["Report 0"])
+
+    def test_formulas_are_defused(self):
+        Report.objects.filter(post_title="Report 1").update(post_title='=HYPERLINK("http://x")')
+        Report.objects.filter(post_title="Report 2").update(post_title='@SUM(A1)')
+
+        self.assertEqual(self.export(status="RESOLVED"),
+                         ["'=HYPERLINK(\"http://x\")", "'@SUM(A1)", "Report 3"])
+
+    def test_bad_date(self):
+        response = self.client.get(reverse('export_reports'), {'from': 'yesterday'})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_last_possible_date(self):
+        self.assertEqual(self.export(status="RESOLVED", to='9999-12-31'), self.export(status="RESOLVED"))
+
+    def test_staff_only(self):
+        self.client.login(username='regularuser', password='testpassword')
+
+        response = self.client.get(reverse('export_reports'))
+
+        self.assertEqual(response.status_code, 403)
+
+
+class AsyncUploadsLoadTestCase(TestCase):
+    """Concurrent requests to the async uploads page while every S3 call
+    takes DELAY seconds, as with a slow or distant S3 endpoint."""
+
+    DELAY = 0.3
+    REQUESTS = 8
+
+    def setUp(self):
+        self.staff_user = User.objects.create_user(
+            username='staffuser',
+            email='staffuser@example.com',
+            password='testpassword',
+            is_staff=True
+        )
+        report = Report.objects.create(
+            post_title="Leak", building_address="1 Main St", landlord_name="Jane",
+            report="Water leak", time_stamp=timezone.now(),
+        )
+        Attachment.objects.create(report=report, key='uploads/alice/1/lease.pdf', size=10)
+
+    def slow_s3(self, bucket_name, key, filename=None):
+        time.sleep(self.DELAY)
+        return 'https://s3/signed'
+
+    async def load(self, pool_size):
+        await self.async_client.aforce_login(self.staff_user)
+        started = time.monotonic()
+        with patch('tenanttalk.file_store.presigned_url', self.slow_s3), \
+                patch('tenanttalk.s3.s3_executor', ThreadPoolExecutor(max_workers=pool_size)):
+            responses = await asyncio.gather(*(
+                self.async_client.get(reverse('viewuploads')) for _ in range(self.REQUESTS)
+            ))
+        self.assertTrue(all(response.status_code == 200 for response in responses))
+        return time.monotonic() - started
+
+    async def test_slow_s3_calls_overlap(self):
+        elapsed = await self.load(pool_size=self.REQUESTS)
+
+        # A sync worker would take REQUESTS * DELAY
+        self.assertLess(elapsed, self.REQUESTS * self.DELAY / 2)
+
+    async def test_pool_bounds_concurrency(self):
+        elapsed = await self.load(pool_size=2)
+
+        self.assertGreaterEqual(elapsed, self.REQUESTS / 2 * self.DELAY)
+
+
+@override_settings(
+    AWS_STORAGE_BUCKET_NAME='tenanttalk-test',
+    AWS_S3_REGION_NAME='us-east-1',
+    AWS_ACCESS_KEY_ID='testing',
+    AWS_SECRET_ACCESS_KEY='testing',
+    UPLOADS_PER_PAGE=2,
+)
+class S3ListingTestCase(TestCase):
+    def setUp(self):
+        mock = mock_aws()
+        mock.start()
+        self.addCleanup(mock.stop)
+        s3_module.reset_s3_client()
+        self.addCleanup(s3_module.reset_s3_client)
+        self.s3 = s3_module.get_s3_client()
+        self.s3.create_bucket(Bucket='tenanttalk-test')
+
+        self.staff_user = User.objects.create_user(
+            username='staffuser',
+            email='staffuser@example.com',
+            password='testpassword',
+            is_staff=True
+        )
+        self.client.login(username='staffuser', password='testpassword')
+
+    def put(self, *keys):
+        for key in keys:
+            self.s3.put_object(Bucket='tenanttalk-test', Key=key, Body=b'x')
+
+    def test_list_tree_pages_past_1000_keys(self):
+        self.put(*(f'uploads/alice/{i:04}.txt' for i in range(1005)))
+        self.put('uploads/bob/1/lease.pdf', 'uploads/readme.txt')
+
+        with patch('tenanttalk.listing.ThreadPoolExecutor', wraps=ThreadPoolExecutor) as pool:
+            objects = listing.list_tree('tenanttalk-test', 'uploads/')
+
+        self.assertEqual(len(objects), 1007)
+        keys = [obj['Key'] for obj in objects]
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(pool.call_args.kwargs['max_workers'], 2)
+
+    def test_bucket_mode_pages_with_start_after(self):
+        self.put('uploads/alice/1/a.pdf', 'uploads/alice/1/b.pdf', 'uploads/bob/2/c.jpg')
+
+        first = self.client.get(reverse('viewuploads'), {'source': 'bucket'})
+        self.assertEqual([f['name'] for f in first.context['files']], ['a.pdf', 'b.pdf'])
+
+        second = self.client.get(reverse('viewuploads'), {'source': 'bucket', 'after': first.context['next_cursor']})
+        self.assertEqual([f['name'] for f in second.context['files']], ['c.jpg'])
+        self.assertIsNone(second.context['next_cursor'])
+
+    def test_bucket_mode_reaches_legacy_prefixes(self):
+        self.put('jpgs/old.jpg', 'pdfs/lease.pdf', 'txts/note.txt', 'uploads/alice/1/a.pdf', 'other/skip.txt')
+
+        first = self.client.get(reverse('viewuploads'), {'source': 'bucket'})
+        second = self.client.get(reverse('viewuploads'), {'source': 'bucket', 'after': first.context['next_cursor']})
+
+        self.assertEqual([f['name'] for f in first.context['files']], ['old.jpg', 'lease.pdf'])
+        self.assertEqual([f['name'] for f in second.context['files']], ['note.txt', 'a.pdf'])
+        self.assertIsNone(second.context['next_cursor'])
+
+    def test_manifest_mode_is_paged(self):
+        report = Report.objects.create(
+            post_title="Leak", building_address="1 Main St", landlord_name="Jane",
+            report="Water leak", time_stamp=timezone.now(),
+        )
+        for name in ('a.pdf', 'b.pdf', 'c.jpg'):
+            Attachment.objects.create(report=report, key=f'uploads/alice/{report.pk}/{name}')
+
+        first = self.client.get(reverse('viewuploads'))
+        second = self.client.get(reverse('viewuploads'), {'after': first.context['next_cursor']})
+
+        self.assertEqual([f['name'] for f in first.context['files']], ['a.pdf', 'b.pdf'])
+        self.assertEqual([f['name'] for f in second.context['files']], ['c.jpg'])
+
+    def test_manifest_mode_pages_past_shared_keys(self):
+        # Five reports, three of them attaching the same file
+        for n, key in enumerate(['blobs/a', 'blobs/a', 'blobs/a', 'blobs/b', 'blobs/b']):
+            report = Report.objects.create(
+                post_title=f"Leak {n}", building_address="1 Main St", landlord_name="Jane",
+                report="Water leak", time_stamp=timezone.now(),
+            )
+            Attachment.objects.create(report=report, key=key, filename=f'{n}.pdf')
+
+        seen, cursor = [], None
+        while True:
+            response = self.client.get(reverse('viewuploads'), {'after': cursor} if cursor else {})
+            seen += [f['name'] for f in response.context['files']]
+            cursor = response.context['next_cursor']
+            if cursor is None:
+                break
+
+        self.assertEqual(seen, ['0.pdf', '1.pdf', '2.pdf', '3.pdf', '4.pdf'])
+
+
+class ThumbnailTestCase(TestCase):
+    def setUp(self):
+        self.report = Report.objects.create(
+            post_title="Leak", building_address="1 Main St", landlord_name="Jane",
+            report="Water leak", time_stamp=timezone.now(),
+        )
+
+    def attach(self, name, data, content_type):
+        key = default_storage.save(f'uploads/alice/{self.report.pk}/{name}', ContentFile(data))
+        self.addCleanup(default_storage.delete, key)
+        return Attachment.objects.create(report=self.report, key=key, content_type=content_type)
+
+    def jpeg(self, size=(1200, 900)):
+        output = BytesIO()
+        Image.new('RGB', size, 'red').save(output, 'JPEG')
+        return output.getvalue()
+
+    def test_image_thumbnail_stored_next_to_original(self):
+        photo = self.attach('photo.jpg', self.jpeg(), 'image/jpeg')
+
+        self.assertEqual(thumbnails.generate_thumbnails([photo]), (1, []))
+
+        photo.refresh_from_db()
+        self.assertEqual(photo.thumbnail, f'uploads/alice/{self.report.pk}/thumbs/photo.jpg.webp')
+        with default_storage.open(photo.thumbnail) as thumbnail:
+            image = Image.open(thumbnail)
+            self.assertEqual((image.format, image.size), ('WEBP', (320, 240)))
+
+    def test_pdf_preview_is_first_page(self):
+        document = thumbnails.pymupdf.open()
+        document.new_page(width=600, height=800)
+        document.new_page(width=800, height=600)
+        lease = self.attach('lease.pdf', document.tobytes(), 'application/pdf')
+
+        thumbnails.generate_thumbnails([lease])
+
+        lease.refresh_from_db()
+        with default_storage.open(lease.thumbnail) as thumbnail:
+            self.assertEqual(Image.open(thumbnail).size, (240, 320))
+
+    def test_huge_pdf_page_rendered_at_thumbnail_size(self):
+        document = thumbnails.pymupdf.open()
+        document.new_page(width=60000, height=30000)
+        plan = self.attach('plan.pdf', document.tobytes(), 'application/pdf')
+
+        with patch('tenanttalk.thumbnails.Image.frombytes', wraps=Image.frombytes) as frombytes:
+            self.assertEqual(thumbnails.generate_thumbnails([plan]), (1, []))
+
+        self.assertEqual(frombytes.call_args.args[1], (320, 160))
+
+    def test_command_skips_text_and_retries_broken_files(self):
+        notes = self.attach('notes.txt', b'no heat', 'text/plain')
+        broken = self.attach('broken.jpg', b'not a jpeg', 'image/jpeg')
+        err = StringIO()
+
+        call_command('generate_thumbnails', stdout=StringIO(), stderr=err)
+
+        notes.refresh_from_db()
+        broken.refresh_from_db()
+        self.assertEqual(notes.thumbnail, '')
+        self.assertIsNotNone(notes.thumbnailed_at)
+        self.assertIsNone(broken.thumbnailed_at)
+        self.assertIn(broken.key, err.getvalue())
+
+    @override_settings(THUMBNAIL_MAX_ATTEMPTS=2)
+    def test_broken_files_given_up_on(self):
+        broken = self.attach('broken.jpg', b'not a jpeg', 'image/jpeg')
+
+        for _ in range(3):
+            call_command('generate_thumbnails', stdout=StringIO(), stderr=StringIO())
+
+        broken.refresh_from_db()
+        self.assertEqual(broken.thumbnail_failures, 2)
+        self.assertFalse(thumbnails.pending_thumbnails().exists())
+
+    def test_decompression_bomb_fails_alone(self):
+        # A PNG claiming 20000x20000 pixels, with a few bytes of pixel data
+        def chunk(kind, data):
+            return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+        bomb = (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', 20000, 20000, 8, 2, 0, 0, 0))
+                + chunk(b'IDAT', zlib.compress(b'')) + chunk(b'IEND', b''))
+        bomb = self.attach('bomb.jpg', bomb, 'image/jpeg')
+        photo = self.attach('photo.jpg', self.jpeg(), 'image/jpeg')
+
+        made, failed = thumbnails.generate_thumbnails([bomb, photo])
+
+        self.assertEqual(made, 1)
+        self.assertEqual([key for key, _ in failed], [bomb.key])
+        self.assertIsInstance(failed[0][1], Image.DecompressionBombError)
+        bomb.refresh_from_db()
+        self.assertIsNone(bomb.thumbnailed_at)
+
+    def test_report_page_lazy_loads_thumbnails(self):
+        staff_user = User.objects.create_user(username='staffuser', password='testpassword', is_staff=True)
+        photo = self.attach('photo.jpg', self.jpeg(), 'image/jpeg')
+        thumbnails.generate_thumbnails([photo])
+        self.client.force_login(staff_user)
+
+        with patch('tenanttalk.file_store.presigned_url', side_effect=lambda bucket, key, filename=None: f'https://s3/{key}'):
+            response = self.client.get(reverse('view_report', args=[self.report.id]))
+
+        self.assertContains(response, f'src="https://s3/uploads/alice/{self.report.pk}/thumbs/photo.jpg.webp" alt="photo.jpg" loading="lazy"')
+
+
+class BlobStorageTestCase(TestCase):
+    def setUp(self):
+        self.regular_user = User.objects.create_user(
+            username='regularuser',
+            email='regularuser@example.com',
+            password='testpassword'
+        )
+        self.client.login(username='regularuser', password='testpassword')
+        self.lease = b'%PDF-1.4 shared lease ' + str(self.id()).encode()
+        self.key = f'blobs/{hashlib.sha256(self.lease).hexdigest()}'
+        self.addCleanup(lambda: default_storage.exists(self.key) and default_storage.delete(self.key))
+
+    def submit_report(self, title, **files):
+        return self.client.post(reverse('report'), {
+            'post_title': title,
+            'building_address': '3 Main St',
+            'landlord_name': 'Jane',
+            'report': f'{title} broken',
+            **files,
+        })
+
+    def pdf(self, name='lease.pdf'):
+        return SimpleUploadedFile(name, self.lease, content_type='application/pdf')
+
+    def test_repeat_upload_skips_storage_write(self):
+        with patch('tenanttalk.uploads.default_storage.save', wraps=default_storage.save) as save:
+            self.submit_report('Heater', pdf=self.pdf())
+            self.submit_report('Mold', pdf=self.pdf('my-lease.pdf'))
+
+        self.assertEqual(save.call_count, 1)
+        heater, mold = Attachment.objects.order_by('id')
+        self.assertEqual((heater.key, mold.key), (self.key, self.key))
+        self.assertEqual((heater.name, mold.name), ('lease.pdf', 'my-lease.pdf'))
+
+    def test_blob_already_in_storage_is_not_written(self):
+        default_storage.save(self.key, ContentFile(self.lease))
+
+        with patch('tenanttalk.uploads.default_storage.save') as save:
+            self.submit_report('Heater', pdf=self.pdf())
+
+        save.assert_not_called()
+        self.assertEqual(Attachment.objects.get().checksum, hashlib.sha256(self.lease).hexdigest())
+
+    def test_digest_taken_while_request_streams(self):
+        with patch('tenanttalk.uploads.file_digest') as file_digest:
+            self.submit_report('Heater', pdf=self.pdf())
+
+        file_digest.assert_not_called()
+        self.assertEqual(Attachment.objects.get().key, self.key)
+
+    def test_shared_blob_thumbnailed_once(self):
+        first = Report.objects.create(post_title="A", building_address="1 Main St", landlord_name="Jane",
+                                      report="a", time_stamp=timezone.now())
+        second = Report.objects.create(post_title="B", building_address="1 Main St", landlord_name="Jane",
+                                       report="b", time_stamp=timezone.now())
+        default_storage.save(self.key, ContentFile(self.lease))
+        attachments = [Attachment.objects.create(report=report, key=self.key, content_type='application/pdf')
+                       for report in (first, second)]
+
+        with patch('tenanttalk.thumbnails.make_thumbnail', return_value='blobs/thumbs/x.webp') as make:
+            thumbnails.generate_thumbnails(attachments)
+
+        self.assertEqual(make.call_count, 1)
+        self.assertEqual(set(Attachment.objects.values_list('thumbnail', flat=True)), {'blobs/thumbs/x.webp'})
+
+
+class LocalFileStoreTestCase(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings_override = override_settings(
+            STORAGES={
+                "default": {
+                    "BACKEND": "django.core.files.storage.FileSystemStorage",
+                    "OPTIONS": {"location": tmp.name},
+                },
+                "staticfiles": {
+                    "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+                },
+            },
+            ATTACHMENT_FILE_STORE='tenanttalk.file_store.LocalFileStore',
+            UPLOADS_PER_PAGE=1,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.staff_user = User.objects.create_user(
+            username='staffuser',
+            email='staffuser@example.com',
+            password='testpassword',
+            is_staff=True
+        )
+        self.client.login(username='staffuser', password='testpassword')
+        self.lease = b'%PDF-1.4 ' + bytes(range(256)) * 4
+        self.client.post(reverse('report'), {
+            'post_title': 'Heater',
+            'building_address': '3 Main St',
+            'landlord_name': 'Jane',
+            'report': 'Broken heater',
+            'pdf': SimpleUploadedFile('lease.pdf', self.lease, content_type='application/pdf'),
+        })
+        self.report = Report.objects.get()
+
+    def file_url(self):
+        response = self.client.get(reverse('view_report', args=[self.report.id]))
+        return response.context['files'][0]['url']
+
+    def test_upload_served_from_disk(self):
+        response = self.client.get(self.file_url())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response, FileResponse)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Content-Disposition'], 'inline; filename="lease.pdf"')
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(response.streaming_content), self.lease)
+
+    async def test_asgi_streams_in_chunks(self):
+        url = await sync_to_async(self.file_url)()
+
+        with patch('tenanttalk.file_store.FILE_CHUNK_SIZE', 100):
+            response = await self.async_client.get(url)
+            chunks = await collect(response.streaming_content)
+            ranged = await self.async_client.get(url, headers={'range': 'bytes=5-'})
+            ranged_chunks = await collect(ranged.streaming_content)
+
+        self.assertTrue(response.is_async)
+        self.assertEqual(response['Content-Length'], str(len(self.lease)))
+        self.assertEqual([len(chunk) for chunk in chunks], [100] * 10 + [len(self.lease) - 1000])
+        self.assertEqual(b''.join(chunks), self.lease)
+        self.assertEqual(ranged.status_code, 206)
+        self.assertEqual(b''.join(ranged_chunks), self.lease[5:])
+
+    def test_declared_types_are_checked(self):
+        response = self.client.post(reverse('report'), {
+            'post_title': 'Script',
+            'building_address': '4 Main St',
+            'landlord_name': 'Jane',
+            'report': 'Not a text file',
+            'txt': SimpleUploadedFile('notes.html', b'<script>alert(1)</script>', content_type='text/html'),
+        })
+
+        self.assertEqual([str(m) for m in response.context['messages']], ['Invalid file format, must be a TXT.'])
+        self.assertFalse(Report.objects.filter(post_title='Script').exists())
+
+    def test_unlisted_types_are_downloads(self):
+        # Stored before declared types were checked
+        key = default_storage.save('uploads/alice/1/page.html', ContentFile(b'<script>alert(1)</script>'))
+        Attachment.objects.create(report=self.report, key=key, filename='page.html', content_type='text/html')
+        notes = default_storage.save('uploads/alice/1/notes.txt', ContentFile(b'no heat'))
+        Attachment.objects.create(report=self.report, key=notes, filename='notes.txt', content_type='text/plain')
+        store = get_file_store()
+
+        response = self.client.get(store.url(key))
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="page.html"')
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+
+        response = self.client.get(store.url(notes))
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="notes.txt"')
+
+    def test_range_requests(self):
+        url = self.file_url()
+
+        response = self.client.get(url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 2-5/{len(self.lease)}')
+        self.assertEqual(b''.join(response.streaming_content), self.lease[2:6])
+
+        response = self.client.get(url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.lease[-10:])
+
+        response = self.client.get(url, HTTP_RANGE=f'bytes={len(self.lease)}-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_tampered_link_is_404(self):
+        self.assertEqual(self.client.get(self.file_url()[:-3] + 'xx/').status_code, 404)
+
+    def test_no_browser_uploads_or_s3(self):
+        response = self.client.post(reverse('sign_upload'), {
+            'field': 'pdf', 'filename': 'lease.pdf', 'content_type': 'application/pdf',
+        })
+        self.assertEqual(response.status_code, 404)
+
+        default_storage.save('uploads/alice/1/a.pdf', ContentFile(b'a'))
+        default_storage.save('uploads/bob/2/b.pdf', ContentFile(b'b'))
+        with patch('tenanttalk.s3.boto3.client') as client:
+            first = self.client.get(reverse('viewuploads'), {'source': 'bucket'})
+            second = self.client.get(reverse('viewuploads'), {'source': 'bucket', 'after': first.context['next_cursor']})
+        client.assert_not_called()
+        self.assertEqual([f['key'] for f in first.context['files']], ['uploads/alice/1/a.pdf'])
+        self.assertEqual([f['key'] for f in second.context['files']], ['uploads/bob/2/b.pdf'])
+        self.assertIsNone(second.context['next_cursor'])
+
+
+class StaticFilesTestCase(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+        settings_override = override_settings(
+            STATIC_ROOT=self.root,
+            STORAGES={
+                "default": {"BACKEND": "django.core.files.storage.InMemoryStorage"},
+                "staticfiles": {"BACKEND": "tenanttalk.staticfiles.StaticFilesStorage"},
+            },
+            STATICFILES_SKIP_UNCHANGED=True,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def collect(self):
+        # Only the app's own files, to keep the run short
+        call_command('collectstatic', interactive=False, verbosity=0,
+                     ignore_patterns=['admin', 'rest_framework', 'django_extensions', 's3direct'])
+
+    def test_hashed_and_compressed(self):
+        self.collect()
+
+        with open(f'{self.root}/staticfiles.json') as f:
+            hashed = json.load(f)['paths']['tenanttalk/style.css']
+        self.assertRegex(hashed, r'^tenanttalk/style\.[0-9a-f]{12}\.css$')
+        for suffix in ('.gz', '.br'):
+            self.assertTrue(os.path.exists(f'{self.root}/{hashed}{suffix}'))
+
+    def test_second_collect_skips_compression(self):
+        self.collect()
+
+        with patch('whitenoise.compress.Compressor.compress_gzip') as gzip, \
+                patch('whitenoise.compress.Compressor.compress_brotli') as brotli:
+            self.collect()
+
+        gzip.assert_not_called()
+        brotli.assert_not_called()
+
+    def test_served_compressed_with_far_future_cache(self):
+        self.collect()
+        with open(f'{self.root}/staticfiles.json') as f:
+            hashed = json.load(f)['paths']['tenanttalk/style.css']
+
+        response = Client().get(f'/static/{hashed}', HTTP_ACCEPT_ENCODING='gzip, br')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=315360000', response['Cache-Control'])
+
+
+# The default storage on S3 (moto), uploading the way settings.py has it
+# when INSTRUMENTATION_ENABLED is on, so every call is counted
+S3_STORAGE_SETTINGS = {
+    'STORAGES': {
+        "default": {"BACKEND": "tenanttalk.s3.S3Storage"},
+        "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    },
+    'AWS_S3_TRANSFER_CONFIG': TransferConfig(use_threads=False),
+}
+
+
+@override_settings(
+    INSTRUMENTATION_ENABLED=True,
+    INSTRUMENTATION_METRICS_TOKEN='scrape-token',
+    AWS_STORAGE_BUCKET_NAME='tenanttalk-test',
+    AWS_S3_REGION_NAME='us-east-1',
+    AWS_ACCESS_KEY_ID='testing',
+    AWS_SECRET_ACCESS_KEY='testing',
+)
+class InstrumentationTestCase(TestCase):
+    def setUp(self):
+        histograms.clear()
+        self.addCleanup(histograms.clear)
+        self.staff_user = User.objects.create_user(
+            username='staffuser',
+            email='staffuser@example.com',
+            password='testpassword',
+            is_staff=True
+        )
+
+    def server_timing(self, response):
+        return {
+            metric.split(';')[0]: metric
+            for metric in response['Server-Timing'].split(', ')
+        }
+
+    def test_server_timing_breaks_down_request(self):
+        Report.objects.create(post_title="Leak", building_address="1 Main St", landlord_name="Jane",
+                              report="Water leak", status='RESOLVED', time_stamp=timezone.now())
+
+        timing = self.server_timing(self.client.get(reverse('home')))
+
+        self.assertEqual(set(timing), {'db', 's3', 'template', 'total'})
+        self.assertRegex(timing['db'], r'^db;dur=[\d.]+;desc="[1-9]\d* queries"$')
+        self.assertIn('desc="1 renders"', timing['template'])
+        self.assertIn('desc="0 calls"', timing['s3'])
+
+    def test_s3_calls_counted_from_pool_threads(self):
+        mock = mock_aws()
+        mock.start()
+        self.addCleanup(mock.stop)
+        s3_module.reset_s3_client()
+        self.addCleanup(s3_module.reset_s3_client)
+        s3 = s3_module.get_s3_client()
+        s3.create_bucket(Bucket='tenanttalk-test')
+        s3.put_object(Bucket='tenanttalk-test', Key='uploads/alice/1/a.pdf', Body=b'x')
+        self.client.login(username='staffuser', password='testpassword')
+
+        response = self.client.get(reverse('viewuploads'), {'source': 'bucket'})
+
+        self.assertRegex(self.server_timing(response)['s3'], r'desc="[1-9]\d* calls"')
+
+    @override_settings(**S3_STORAGE_SETTINGS)
+    def test_storage_calls_counted_from_upload_pool(self):
+        mock = mock_aws()
+        mock.start()
+        self.addCleanup(mock.stop)
+        s3_module.get_s3_client().create_bucket(Bucket='tenanttalk-test')
+        self.addCleanup(s3_module.reset_s3_client)
+        lease = SimpleUploadedFile('lease.pdf', b'%PDF-1.4 lease', content_type='application/pdf')
+
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        try:
+            uploads_module.store_blobs([(lease, None)])
+        finally:
+            current_timings.reset(token)
+
+        # The HEAD that finds no blob yet, then the PUT
+        self.assertEqual(timings.counts['s3'], 2)
+
+    def test_metrics_histogram_per_view(self):
+        self.client.get(reverse('home'))
+        self.client.get(reverse('home'))
+        self.client.login(username='staffuser', password='testpassword')
+
+        response = self.client.get(reverse('metrics'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('tenanttalk_request_duration_seconds_count{view="home"} 2', body)
+        self.assertIn('tenanttalk_request_duration_seconds_bucket{view="home",le="+Inf"} 2', body)
+        self.assertIn('# TYPE tenanttalk_request_db_queries_total counter', body)
+        self.assertRegex(body, r'tenanttalk_request_template_renders_total\{view="home"\} 2\n')
+
+    def test_metrics_needs_staff_or_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-token').status_code, 200)
+
+    @override_settings(INSTRUMENTATION_ENABLED=False)
+    def test_disabled(self):
+        response = self.client.get(reverse('home'))
+
+        self.assertNotIn('Server-Timing', response)
+        self.assertNotIn('view="home"', histograms.exposition())
+
+
+class QueryBudget(ContextDecorator):
+    """Fails when the block runs more than ``queries`` SQL queries or makes
+    more than ``s3_calls`` S3 API calls. Counts come from the request
+    instrumentation, so work done in sync_to_async and S3 pool threads is
+    included. Use as ``with QueryBudget(queries=5):`` or as a decorator.
+    """
+
+    def __init__(self, queries=None, s3_calls=None):
+        self.queries = queries
+        self.s3_calls = s3_calls
+
+    def __enter__(self):
+        self.timings = RequestTimings()
+        self.token = current_timings.set(self.timings)
+        self.captured = CaptureQueriesContext(connection).__enter__()
+        return self.timings
+
+    def __exit__(self, exc_type, exc, tb):
+        self.captured.__exit__(exc_type, exc, tb)
+        current_timings.reset(self.token)
+        if exc_type is not None:
+            return False
+
+        counts = self.timings.counts
+        if self.queries is not None and counts['db'] > self.queries:
+            statements = '\n'.join(f'  {query["sql"]}' for query in self.captured.captured_queries)
+            raise AssertionError(f"{counts['db']} queries, budget is {self.queries}:\n{statements}")
+        if self.s3_calls is not None and counts['s3'] > self.s3_calls:
+            raise AssertionError(f"{counts['s3']} S3 calls, budget is {self.s3_calls}")
+        return False
+
+
+@override_settings(
+    AWS_STORAGE_BUCKET_NAME='tenanttalk-test',
+    AWS_S3_REGION_NAME='us-east-1',
+    AWS_ACCESS_KEY_ID='testing',
+    AWS_SECRET_ACCESS_KEY='testing',
+    REPORT_DIRECT_UPLOADS=True,
+    REPORTS_PER_PAGE=20,
+)
+class QueryBudgetTestCase(TestCase):
+    """Query and S3 call budgets for the main pages, over enough data that
+    a query per report or per attachment would blow them.
+
+    The budgets are today's counts. If a change needs more, raise the
+    number in the same commit and say why.
+    """
+
+    REPORTS = 300
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.regular_user = User.objects.create_user(
+            username='regularuser', email='regularuser@example.com', password='testpassword')
+        cls.staff_user = User.objects.create_user(
+            username='staffuser', email='staffuser@example.com', password='testpassword', is_staff=True)
+
+        # Loaded the way import_reports loads them, landlords and buildings included
+        now = timezone.now()
+        statuses = ('NEW', 'IN_PROGRESS', 'RESOLVED')
+        bulk.import_batch([
+            bulk.build_report({
+                'post_title': f"Issue {i}",
+                'building_address': f"{i % 40} Main St",
+                'landlord_name': f"Landlord {i % 25}",
+                'report': f"Report number {i}",
+                'time_stamp': (now - timedelta(hours=i)).isoformat(),
+                'status': statuses[i % 3],
+                'verify': 'T' if i % 2 else 'F',
+                'user': 'regularuser' if i % 4 == 0 else f'tenant{i % 30}',
+            })
+            for i in range(cls.REPORTS)
+        ])
+        reports = list(Report.objects.order_by('-time_stamp'))
+        Attachment.objects.bulk_create(
+            Attachment(report=report, key=f'blobs/{report.pk:064x}{n}', filename=f'file{n}.pdf', size=10)
+            for report in reports for n in range(3)
+        )
+        cls.report = reports[0]
+
+    def setUp(self):
+        mock = mock_aws()
+        mock.start()
+        self.addCleanup(mock.stop)
+        s3_module.reset_s3_client()
+        self.addCleanup(s3_module.reset_s3_client)
+        self.s3 = s3_module.get_s3_client()
+        self.s3.create_bucket(Bucket='tenanttalk-test')
+        cache.clear()
+
+    def test_home(self):
+        with QueryBudget(queries=2, s3_calls=0):
+            response = self.client.get(reverse('home'))
+        self.assertEqual(len(response.context['items_page']), 20)
+
+    def test_myaccount_user(self):
+        self.client.force_login(self.regular_user)
+        with QueryBudget(queries=3, s3_calls=0):
+            response = self.client.get(reverse('myaccount'))
+        self.assertEqual(len(response.context['items_page']), 20)
+
+    def test_myaccount_staff(self):
+        self.client.force_login(self.staff_user)
+        with QueryBudget(queries=4, s3_calls=0):
+            response = self.client.get(reverse('myaccount'))
+        self.assertTrue(all(queue['page'].has_next() for queue in response.context['queues']))
+
+    def test_view_report(self):
+        self.client.force_login(self.staff_user)
+        with QueryBudget(queries=4, s3_calls=0):
+            response = self.client.get(reverse('view_report', args=[self.report.pk]))
+        self.assertEqual(len(response.context['files']), 3)
+
+    def test_view_report_resolve(self):
+        self.client.force_login(self.staff_user)
+        with QueryBudget(queries=5, s3_calls=0):
+            response = self.client.post(reverse('view_report', args=[self.report.pk]), {'resolve': '1'})
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(**S3_STORAGE_SETTINGS)
+    def test_report_post(self):
+        self.client.force_login(self.regular_user)
+        upload = self.client.post(reverse('sign_upload'), {
+            'field': 'jpg', 'filename': 'mold.jpg', 'content_type': 'image/jpeg',
+        }).json()
+        self.s3.put_object(Bucket='tenanttalk-test', Key=upload['key'], Body=b'jpeg')
+
+        with QueryBudget(queries=17, s3_calls=5) as timings:
+            response = self.client.post(reverse('report'), {
+                'post_title': 'Heater',
+                'building_address': '3 Main St',
+                'landlord_name': 'Jane',
+                'report': 'Broken heater',
+                'pdf': SimpleUploadedFile('lease.pdf', b'%PDF-1.4 lease', content_type='application/pdf'),
+                'txt': SimpleUploadedFile('notes.txt', b'notes', content_type='text/plain'),
+                'jpg_key': upload['key'],
+            })
+
+        self.assertEqual(response.status_code, 302)
+        # The HEAD that confirms the browser upload arrived, then a HEAD and
+        # a PUT for each of the two blobs written from the upload pool
+        self.assertEqual(timings.counts['s3'], 5)
+        self.assertEqual(Report.objects.get(post_title='Heater').attachments.count(), 3)
+        self.assertEqual(self.s3.list_objects_v2(Bucket='tenanttalk-test', Prefix='blobs/')['KeyCount'], 2)
+
+    def test_budget_catches_n_plus_one(self):
+        with self.assertRaisesMessage(AssertionError, 'budget is 2'):
+            with QueryBudget(queries=2):
+                for report in Report.objects.all()[:5]:
+                    list(report.attachments.all())
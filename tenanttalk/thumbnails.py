@@ -0,0 +1,156 @@
+import io
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+try:
+    import pymupdf  # optional: without it PDFs get no preview
+except ImportError:
+    pymupdf = None
+
+from .models import Attachment
+
+
+IMAGE_TYPES = ('image/jpeg', 'image/png', 'image/webp', 'image/gif')
+PDF_TYPE = 'application/pdf'
+
+
+def thumbnail_format():
+    """(Pillow format, extension), WebP where Pillow was built with it."""
+    if features.check('webp'):
+        return 'WEBP', 'webp'
+    return 'JPEG', 'jpg'
+
+
+def thumbnail_key(key):
+    # blobs/<sha256> -> blobs/thumbs/<sha256>.webp
+    # uploads/alice/12/photo.jpg -> uploads/alice/12/thumbs/photo.jpg.webp
+    folder, _, name = key.rpartition('/')
+    return f"{folder}/thumbs/{name}.{thumbnail_format()[1]}".lstrip('/')
+
+
+def attachment_type(attachment):
+    return attachment.content_type or mimetypes.guess_type(attachment.key)[0] or ''
+
+
+def has_thumbnail(content_type):
+    return content_type in IMAGE_TYPES or (content_type == PDF_TYPE and pymupdf is not None)
+
+
+def open_image(data, content_type):
+    if content_type == PDF_TYPE:
+        with pymupdf.open(stream=data, filetype='pdf') as document:
+            if not document.page_count:
+                return None
+            # Rendered no bigger than the thumbnail, so a page declared
+            # thousands of inches across costs no more than a normal one
+            page = document[0].rect
+            if page.is_empty:
+                return None
+            width, height = settings.THUMBNAIL_SIZE
+            zoom = min(settings.THUMBNAIL_PDF_DPI / 72, width / page.width, height / page.height)
+            pixmap = document[0].get_pixmap(matrix=pymupdf.Matrix(zoom, zoom))
+            return Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+
+    image = Image.open(io.BytesIO(data))
+    # JPEGs can be decoded straight at a fraction of their size, which is
+    # most of the work saved on phone photos
+    image.draft('RGB', settings.THUMBNAIL_SIZE)
+    return ImageOps.exif_transpose(image)
+
+
+def render_thumbnail(data, content_type):
+    """Bytes of the resized image or first PDF page, or None if there is
+    nothing to draw."""
+    image = open_image(data, content_type)
+    if image is None:
+        return None
+    image.thumbnail(settings.THUMBNAIL_SIZE)
+
+    image_format, _ = thumbnail_format()
+    if image.mode not in ('RGB', 'RGBA') or (image_format == 'JPEG' and image.mode == 'RGBA'):
+        image = image.convert('RGB')
+    output = io.BytesIO()
+    image.save(output, image_format, quality=settings.THUMBNAIL_QUALITY)
+    return output.getvalue()
+
+
+def make_thumbnail(attachment):
+    """Write the thumbnail for one attachment next to the original.
+
+    Returns its key, or '' for files that have no thumbnail.
+    """
+    content_type = attachment_type(attachment)
+    if not has_thumbnail(content_type):
+        return ''
+    with default_storage.open(attachment.key) as original:
+        data = render_thumbnail(original.read(), content_type)
+    if data is None:
+        return ''
+
+    key = thumbnail_key(attachment.key)
+    if default_storage.exists(key):
+        default_storage.delete(key)
+    return default_storage.save(key, ContentFile(data))
+
+
+def pending_thumbnails():
+    return Attachment.objects.filter(
+        thumbnailed_at__isnull=True, thumbnail_failures__lt=settings.THUMBNAIL_MAX_ATTEMPTS,
+    ).order_by('id')
+
+
+def generate_thumbnails(attachments, workers=None):
+    """Make thumbnails for ``attachments`` on a small thread pool, since most
+    of the time is spent fetching originals and writing results to S3.
+
+    Returns (thumbnails made, [(key, error), ...]). Attachments that failed
+    are left pending so the next run tries them again, up to
+    THUMBNAIL_MAX_ATTEMPTS runs in all.
+    """
+    attachments = list(attachments)
+
+    # Attachments share blobs, so content that already has a thumbnail is
+    # not drawn again, and each key is drawn once per batch
+    results = {
+        key: (thumbnail, None)
+        for key, thumbnail in Attachment.objects.filter(key__in={attachment.key for attachment in attachments})
+        .exclude(thumbnail='')
+        .values_list('key', 'thumbnail')
+    }
+    to_draw = {attachment.key: attachment for attachment in attachments if attachment.key not in results}
+
+    def attempt(attachment):
+        # Anything an upload can make Pillow or PyMuPDF raise, such as
+        # DecompressionBombError for a tiny file claiming billions of pixels,
+        # fails that attachment alone rather than the whole batch
+        try:
+            return make_thumbnail(attachment), None
+        except Exception as error:
+            return None, error
+
+    with ThreadPoolExecutor(max_workers=workers or settings.THUMBNAIL_WORKERS,
+                            thread_name_prefix='thumbnail') as pool:
+        results.update(zip(to_draw, pool.map(attempt, to_draw.values())))
+
+    made, failed, done, failed_ids = 0, [], [], []
+    now = timezone.now()
+    for attachment in attachments:
+        key, error = results[attachment.key]
+        if error is not None:
+            failed.append((attachment.key, error))
+            failed_ids.append(attachment.id)
+            continue
+        attachment.thumbnail = key
+        attachment.thumbnailed_at = now
+        done.append(attachment)
+        made += bool(key)
+    Attachment.objects.bulk_update(done, ['thumbnail', 'thumbnailed_at'])
+    Attachment.objects.filter(id__in=failed_ids).update(thumbnail_failures=F('thumbnail_failures') + 1)
+    return made, failed
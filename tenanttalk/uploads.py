@@ -0,0 +1,226 @@
+import contextvars
+import hashlib
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Attachment
+from .file_store import get_file_store
+
+
+# Report form file fields and the content types each one accepts
+UPLOAD_FIELDS = {
+    'pdf': ('application/pdf',),
+    'txt': ('text/plain',),
+    'jpg': ('image/jpeg',),
+}
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadSizeLimitHandler(FileUploadHandler):
+    """Drops a file from request.FILES as soon as it passes
+    REPORT_UPLOAD_MAX_SIZE, instead of spooling all of it first.
+
+    Field names of dropped files are left on ``request.oversized_uploads``.
+    The sha256 of each file is worked out as its chunks arrive and left on
+    ``request.upload_digests`` by field name, so storing it needs no
+    second pass.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.request.oversized_uploads = []
+        self.request.upload_digests = {}
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.sha256 = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.REPORT_UPLOAD_MAX_SIZE:
+            self.request.oversized_uploads.append(self.field_name)
+            raise SkipFile()
+        self.sha256.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        self.request.upload_digests[self.field_name] = self.sha256.hexdigest()
+        return None
+
+
+class MeteredUpload(File):
+    """Wraps an uploaded file so storage can read it in chunks while the
+    bytes are counted on the way past. The blob digest is already known by
+    then, from UploadSizeLimitHandler or file_digest().
+
+    Reading past ``max_size`` raises UploadTooLarge. Seeking back to the
+    start begins the count again, since storages rewind before they read.
+    """
+
+    def __init__(self, file, max_size):
+        super().__init__(file, name=file.name)
+        self.max_size = max_size
+        # Storages read this for the stored object's Content-Type, which
+        # the name can no longer tell them once it is a hash
+        self.content_type = getattr(file, 'content_type', None)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.bytes_read += len(data)
+        if self.bytes_read > self.max_size:
+            raise UploadTooLarge(self.name)
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        position = self.file.seek(offset, whence)
+        if self.file.tell() == 0:
+            self.bytes_read = 0
+        return position
+
+
+# Shared by every request in the process so a burst of reports cannot open
+# an unbounded number of storage writes
+_upload_pool = ThreadPoolExecutor(
+    max_workers=settings.REPORT_UPLOAD_WORKERS,
+    thread_name_prefix='report-upload',
+)
+
+
+def blob_key(digest):
+    return f'blobs/{digest}'
+
+
+def file_digest(file):
+    file.seek(0)
+    sha256 = hashlib.sha256()
+    for chunk in file.chunks():
+        sha256.update(chunk)
+    file.seek(0)
+    return sha256.hexdigest()
+
+
+def write_blob(file, key):
+    # Another report may have stored the same content without its row
+    # being committed yet; a HEAD is still far cheaper than the PUT
+    if default_storage.exists(key):
+        return key
+    return default_storage.save(key, MeteredUpload(file, settings.REPORT_UPLOAD_MAX_SIZE))
+
+
+def store_blobs(uploads):
+    """Store (file, sha256) pairs by content under blobs/<sha256>.
+
+    Content an Attachment already refers to is not written again; the rest
+    is written at the same time, so a report waits for its slowest file
+    rather than the sum of them. A digest of None is worked out here.
+    Returns (key, size, sha256) in the order given.
+    """
+    digests = [digest or file_digest(file) for file, digest in uploads]
+    stored = set(
+        Attachment.objects.filter(key__in=[blob_key(digest) for digest in digests])
+        .values_list('key', flat=True)
+    )
+
+    writes = {}
+    for (file, _), digest in zip(uploads, digests):
+        key = blob_key(digest)
+        if key not in stored and key not in writes:
+            # In a copy of this context, so the request's instrumentation
+            # still sees the storage calls
+            writes[key] = _upload_pool.submit(contextvars.copy_context().run, write_blob, file, key)
+
+    results = []
+    for (file, _), digest in zip(uploads, digests):
+        key = blob_key(digest)
+        if key in writes:
+            key = writes[key].result()
+        results.append((key, file.size, digest))
+    return results
+
+
+def allow_direct_upload(user):
+    """Count one signed upload against ``user``'s hourly allowance. False
+    once DIRECT_UPLOAD_HOURLY_LIMIT is used up."""
+    key = f'direct-uploads:{user.pk}'
+    cache.add(key, 0, timeout=3600)
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        # Expired between add() and incr()
+        cache.set(key, 1, timeout=3600)
+        count = 1
+    return count <= settings.DIRECT_UPLOAD_HOURLY_LIMIT
+
+
+def sign_direct_upload(field, user_name, filename, content_type):
+    """Presigned POST that lets the browser send one report attachment
+    straight to S3. Returns None if the field or content type is not
+    allowed, or the file store cannot take browser uploads.
+
+    The policy pins the key, content type and size range, so the server
+    only has to record the key when the report is submitted.
+    """
+    filename = filename.replace('/', '_')[:100]
+    if not filename or content_type not in UPLOAD_FIELDS.get(field, ()):
+        return None
+
+    key = f'uploads/{user_name}/direct/{uuid.uuid4().hex}/{filename}'
+    post = get_file_store().sign_upload(key, content_type)
+    if post is None:
+        return None
+    return {'url': post['url'], 'fields': post['fields'], 'key': key}
+
+
+def record_direct_upload(report, key):
+    """Attachment row for a file the browser already put in the bucket, or
+    None if it never arrived."""
+    head = get_file_store().head(key)
+    if head is None:
+        return None
+    return Attachment.objects.create(
+        report=report,
+        key=key,
+        size=head['size'],
+        content_type=head['content_type'],
+    )
+
+
+def purge_direct_uploads(hours=None):
+    """Delete browser uploads older than ``hours`` that no report recorded:
+    forms never submitted, or rejected as duplicates. Returns how many went.
+
+    A bucket lifecycle rule cannot do this, as recorded uploads keep their
+    uploads/<user>/direct/ keys.
+    """
+    store = get_file_store()
+    if not store.direct_uploads:
+        return 0
+    cutoff = timezone.now() - timedelta(hours=settings.DIRECT_UPLOAD_ORPHAN_HOURS if hours is None else hours)
+    stale = [
+        obj['Key'] for obj in store.list_tree('uploads/')
+        if '/direct/' in obj['Key'] and obj['LastModified'] < cutoff
+    ]
+    # Thumbnails of recorded uploads sit under the same direct/ folder
+    recorded = set()
+    for start in range(0, len(stale), 1000):
+        batch = stale[start:start + 1000]
+        for key, thumbnail in Attachment.objects.filter(Q(key__in=batch) | Q(thumbnail__in=batch)).values_list(
+                'key', 'thumbnail'):
+            recorded.update((key, thumbnail))
+    orphans = [key for key in stale if key not in recorded]
+    store.delete(orphans)
+    return len(orphans)
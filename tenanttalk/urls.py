@@ -1,7 +1,7 @@
 from django.urls import path, include
 from django.contrib import admin
 from django.contrib.auth.views import LogoutView
-from . import views
+from . import views, api
 
 urlpatterns = [
     # Include admin URLs
@@ -10,10 +10,21 @@ urlpatterns = [
     #path('adminaccount/', views.myaccount, name='adminaccount'),
     path('', views.home, name='home'),
     path('myaccount/', views.myaccount, name='myaccount'),
+    path('myaccount/queue/<str:status>/', views.staff_queue, name='staff_queue'),
+    path('myaccount/export/', views.export_reports, name='export_reports'),
+    path('search/', views.search, name='search'),
+    path('landlord/<int:landlord_id>/', views.landlord_profile, name='landlord_profile'),
+    path('building/<int:building_id>/', views.building_profile, name='building_profile'),
     path('report/', views.report, name='report'),
+    path('report/sign-upload/', views.sign_upload, name='sign_upload'),
     # path('upload/', views.upload, name='upload'),
     path('viewuploads/', views.viewuploads, name='viewuploads'),
+    path('files/<str:token>/', views.attachment_file, name='attachment_file'),
+    path('metrics/', views.metrics, name='metrics'),
     path('viewreport/<int:report_id>/', views.view_report, name='view_report'),
+    path('api/reports/', api.ReportListView.as_view(), name='api_reports'),
+    path('api/reports/<int:pk>/', api.ReportDetailView.as_view(), name='api_report'),
+    path('api/reports/moderate/', api.BulkModerationView.as_view(), name='bulk_moderation'),
     # path('accounts/', include('allauth.urls')),  # resetting everything
     # path('accounts/google/login/', views.redirect_to_google_login, name='google_login'),
     path('accounts/login/', views.custom_login, name='custom_login'),
@@ -1,19 +1,31 @@
+import mimetypes
 import urllib
+from datetime import date, datetime, time, timedelta
 
-from django.shortcuts import render, get_object_or_404
+from django.shortcuts import render, get_object_or_404, aget_object_or_404
+from asgiref.sync import sync_to_async
 from django.views import View
 from django.shortcuts import render, redirect
-from django.core.files.storage import default_storage
-from io import BytesIO
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from django.conf import settings
 from django.utils import timezone
-from django.http import JsonResponse
-import boto3
-from .models import Report
-
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.core import signing
+from django.core.files.storage import default_storage
+from .bulk import aexport_rows, csv_lines
+from .models import Report, Attachment, Landlord, Building, report_content_hash
+from .s3 import run_in_s3_pool
+from .file_store import LocalFileStore, file_response, get_file_store
+from .attachments import BUCKET_PREFIXES
+from .uploads import UPLOAD_FIELDS, allow_direct_upload, store_blobs, sign_direct_upload, record_direct_upload
+from django.views.decorators.http import require_POST
+
+from .pagination import paginate_request, KeysetPaginator, InvalidCursor
+from .feed_cache import cached_feed_page
+from .search import search_reports
+from .instrumentation import histograms
 
 from django.contrib.auth import authenticate, login, logout
 
@@ -29,24 +41,62 @@ from django.contrib.auth import logout as auth_logout
 from django.core.exceptions import ValidationError
 
 
-def home(request):
-    default_page = 1
-    page = request.GET.get('page', default_page)
+# Keyset orderings; the trailing id makes every position unique
+FEED_ORDERING = ('-verify', '-time_stamp', '-id')
+USER_REPORTS_ORDERING = ('-time_stamp', '-id')
+
 
+def home(request):
     # This will order verified (TRUE) first and then by timestamp
-    approved_reports = Report.objects.filter(status='RESOLVED').order_by('-verify', '-time_stamp')
+    approved_reports = Report.objects.filter(status='RESOLVED')
+
+    # Served from the cache until a report is resolved or its verification changes
+    items_page = cached_feed_page(request, approved_reports, FEED_ORDERING, settings.REPORTS_PER_PAGE)
+
+    return render(request, 'tenanttalk/home.html', {'approved_reports': approved_reports, 'items_page': items_page})
 
-    items_per_page = 3
-    paginator = Paginator(approved_reports, items_per_page)
+def landlord_profile(request, landlord_id):
+    landlord = get_object_or_404(Landlord, pk=landlord_id)
+    items_page = paginate_request(request, landlord.reports.filter(status='RESOLVED'), FEED_ORDERING, settings.REPORTS_PER_PAGE)
+    return render(request, 'tenanttalk/profile.html', {'profile': landlord, 'title': landlord.name, 'items_page': items_page})
 
+
+def building_profile(request, building_id):
+    building = get_object_or_404(Building, pk=building_id)
+    items_page = paginate_request(request, building.reports.filter(status='RESOLVED'), FEED_ORDERING, settings.REPORTS_PER_PAGE)
+    return render(request, 'tenanttalk/profile.html', {'profile': building, 'title': building.address, 'items_page': items_page})
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()[:200]
     try:
-        items_page = paginator.page(page)
-    except PageNotAnInteger:
-        items_page = paginator.page(default_page)
-    except EmptyPage:
-        items_page = paginator.page(paginator.num_pages)
+        # Clamped, as a huge page number overflows the OFFSET
+        page = min(max(int(request.GET.get('page', 1)), 1), settings.SEARCH_MAX_PAGE)
+    except ValueError:
+        page = 1
+
+    results, has_next = [], False
+    if query:
+        results, has_next = search_reports(query, page=page, per_page=settings.SEARCH_RESULTS_PER_PAGE)
+
+    return render(request, 'tenanttalk/search.html', {
+        'query': query,
+        'results': results,
+        'page': page,
+        'has_next': has_next,
+    })
+
+def report_user_name(request):
+    if request.user.is_authenticated:
+        return request.user.username[:30]  # Truncate to max length
+    return "ANONYMOUS"
+
+
+def render_report_form(request):
+    # Only logged-in users may upload straight to the bucket
+    direct_uploads = direct_uploads_enabled() and request.user.is_authenticated
+    return render(request, "tenanttalk/report.html", {'direct_uploads': direct_uploads})
 
-    return render(request, 'tenanttalk/home.html', {'approved_reports': approved_reports, 'items_page': items_page})
 
 def report(request):
     if request.method == 'POST':
@@ -57,18 +107,29 @@ def report(request):
         report_text = request.POST.get('report', '')[:200]  # Truncate to max length
         timestamp = timezone.now()
 
+        # Check the attachments before anything is written
+        if getattr(request, 'oversized_uploads', None):
+            max_mb = settings.REPORT_UPLOAD_MAX_SIZE // (1024 * 1024)
+            messages.error(request, f"Attached files must be {max_mb} MB or smaller.")
+            return render_report_form(request)
+
+        # The declared type is what the file is later served as, so it is
+        # held to the same list as browser uploads
+        for field, content_types in UPLOAD_FIELDS.items():
+            if field in request.FILES and request.FILES[field].content_type not in content_types:
+                messages.error(request, f"Invalid file format, must be a {field.upper()}.")
+                return render_report_form(request)
+
         # Check if a similar report already exists
+        # (an indexed hash lookup; differences in case or spacing don't count)
         existing_report = Report.objects.filter(
-            post_title=post_title,
-            building_address=building_address,
-            landlord_name=landlord_name,
-            report=report_text,
+            content_hash=report_content_hash(post_title, building_address, landlord_name, report_text),
         ).exists()
 
         if existing_report:
             messages.warning(request,
                              "A similar report already exists. Please check your inputs or submit a new report with different details.")
-            return render(request, "tenanttalk/report.html")
+            return render_report_form(request)
 
         new_report = Report(
             post_title=post_title,
@@ -78,99 +139,200 @@ def report(request):
             time_stamp=timestamp,
         )
 
+        user_name = report_user_name(request)
         if request.user.is_authenticated:
-            user_name = request.user.username[:30]  # Truncate to max length
             new_report.user = user_name
-        else:
-            user_name = "ANONYMOUS"
 
         try:
             new_report.save()
         except ValidationError as e:
             # Handle validation errors (e.g., length violations)
             messages.error(request, f"Error saving report: {e}")
-            return render(request, "tenanttalk/report.html")
+            return render_report_form(request)
+
+        # Handle optional file uploads. Files are stored by content hash
+        # (worked out while the request body arrived), so a file that is
+        # already in the bucket is only referenced, not uploaded again.
+        digests = getattr(request, 'upload_digests', {})
+        pending = []
+        for field in ('pdf', 'txt', 'jpg'):
+            upload_file = request.FILES.get(field)
+            if upload_file and upload_file.size > 0:
+                pending.append((upload_file, digests.get(field)))
+
+        attachments = {}
+        for (upload_file, _), (key, size, checksum) in zip(pending, store_blobs(pending)):
+            # The same file in two fields is one attachment
+            attachments.setdefault(key, Attachment(
+                report=new_report,
+                key=key,
+                filename=upload_file.name[:100],
+                size=size,
+                content_type=upload_file.content_type or '',
+                checksum=checksum,
+            ))
+        Attachment.objects.bulk_create(attachments.values())
+
+        # Files the browser already sent straight to S3 only need recording
+        signed_uploads = request.session.pop('signed_uploads', {})
+        for field, key in signed_uploads.items():
+            if field in request.FILES or request.POST.get(f'{field}_key') != key:
+                continue
+            if record_direct_upload(new_report, key) is None:
+                messages.warning(request, f"Your {field.upper()} file did not finish uploading and was not attached.")
 
-        # File upload handling
-        post_id = post_title + '-' + timestamp.strftime('%Y%m%d-%H%M')
+        # Redirect to home or another relevant page
+        return redirect('home')  # Change 'home' to your desired redirect view name
 
-        def save_file(file, filename):
-            if file and file.size > 0:
-                data = BytesIO(file.read())
-                default_storage.save(filename, data)
+    # Render the report page for GET requests
+    return render_report_form(request)
+
+
+@require_POST
+def sign_upload(request):
+    # Signs one browser-to-S3 upload for the report form; report() records
+    # the key when the form is submitted
+    if not direct_uploads_enabled():
+        return JsonResponse({'error': 'Direct uploads are not enabled.'}, status=404)
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Log in to upload files directly.'}, status=403)
+    if not allow_direct_upload(request.user):
+        return JsonResponse({'error': 'Too many uploads, try again later.'}, status=429)
+
+    field = request.POST.get('field', '')
+    upload = sign_direct_upload(
+        field,
+        report_user_name(request),
+        request.POST.get('filename', ''),
+        request.POST.get('content_type', ''),
+    )
+    if upload is None:
+        return JsonResponse({'error': 'That file type is not accepted for this field.'}, status=400)
 
-        # Handle optional file uploads with proper error handling
-        if 'pdf' in request.FILES:
-            pdf_file = request.FILES['pdf']
-            if pdf_file.content_type != 'application/pdf':
-                messages.error(request, "Invalid file format, must be a PDF.")
-                return render(request, "tenanttalk/report.html")
+    signed_uploads = request.session.get('signed_uploads', {})
+    signed_uploads[field] = upload['key']
+    request.session['signed_uploads'] = signed_uploads
+    return JsonResponse(upload)
 
-            object_name = f'uploads/{user_name}/{post_id}/{pdf_file.name[:100]}'
-            save_file(pdf_file, object_name)
 
-        if 'txt' in request.FILES:
-            txt_file = request.FILES['txt']
-            object_name = f'uploads/{user_name}/{post_id}/{txt_file.name[:100]}'
-            save_file(txt_file, object_name)
+# Staff moderation columns, each paged oldest first
+STAFF_QUEUES = (('NEW', 'New'), ('IN_PROGRESS', 'In-Progress'))
+QUEUE_ORDERING = ('time_stamp', 'id')
+QUEUE_FIELDS = ('id', 'post_title', 'building_address', 'landlord_name', 'time_stamp', 'status')
 
-        if 'jpg' in request.FILES:
-            jpg_file = request.FILES['jpg']
-            object_name = f'uploads/{user_name}/{post_id}/{jpg_file.name[:100]}'
-            save_file(jpg_file, object_name)
 
-        # Redirect to home or another relevant page
-        return redirect('home')  # Change 'home' to your desired redirect view name
+def staff_queue_page(status, after=None):
+    reports = Report.objects.filter(status=status).only(*QUEUE_FIELDS)
+    paginator = KeysetPaginator(reports, QUEUE_ORDERING, settings.STAFF_QUEUE_PAGE_SIZE)
+    return paginator.page(after=after)
 
-    # Render the report page for GET requests
-    return render(request, "tenanttalk/report.html")
 
+def staff_queue(request, status):
+    """Next page of a moderation column as JSON, for the dashboard's load more."""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Staff only.'}, status=403)
+    if status not in dict(STAFF_QUEUES):
+        return JsonResponse({'error': 'Unknown status.'}, status=404)
 
-def myaccount(request):
-    default_page = 1
-    page = request.GET.get('page', default_page)
+    try:
+        page = staff_queue_page(status, after=request.GET.get('after'))
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor.'}, status=400)
+
+    return JsonResponse({
+        'reports': [
+            {
+                'id': report.id,
+                'post_title': report.post_title,
+                'building_address': report.building_address,
+                'landlord_name': report.landlord_name,
+                'time_stamp': report.time_stamp.isoformat(),
+                'url': reverse('view_report', args=[report.id]),
+            }
+            for report in page
+        ],
+        'next_cursor': page.next_cursor,
+    })
+
+
+def filter_export(reports, params):
+    """Apply the export form's filters. Raises ValueError (or OverflowError)
+    on a bad date."""
+    if params.get('status'):
+        reports = reports.filter(status=params['status'])
+    if params.get('landlord'):
+        reports = reports.filter(landlord__normalized=Landlord.normalize(params['landlord']))
+    if params.get('address'):
+        reports = reports.filter(building__normalized=Building.normalize(params['address']))
+    # Whole days in the site's time zone, as a plain time_stamp range
+    if params.get('from'):
+        start = datetime.combine(date.fromisoformat(params['from']), time.min)
+        reports = reports.filter(time_stamp__gte=timezone.make_aware(start))
+    # The last day there is has no next day to stop before, and nothing after it
+    if params.get('to') and (to := date.fromisoformat(params['to'])) < date.max:
+        end = datetime.combine(to + timedelta(days=1), time.min)
+        reports = reports.filter(time_stamp__lt=timezone.make_aware(end))
+    return reports
+
+
+def export_reports(request):
+    """Matching reports as CSV, streamed straight from the database cursor so
+    large exports start at once and never sit in memory. Staff only."""
+    if not request.user.is_staff:
+        return HttpResponseForbidden('Staff only.')
+    if request.GET.get('status') and request.GET['status'] not in dict(Report.STATUS_CHOICES):
+        return HttpResponseBadRequest('Unknown status.')
+    try:
+        reports = filter_export(Report.objects.all(), request.GET)
+    except (ValueError, OverflowError):
+        return HttpResponseBadRequest('Dates must be YYYY-MM-DD.')
+
+    response = StreamingHttpResponse(csv_lines(aexport_rows(reports)), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="reports-{timezone.now():%Y%m%d}.csv"'
+    return response
+
+
+
+def metrics(request):
+    """Per-view request timings in Prometheus' text format, for staff or a
+    scraper holding INSTRUMENTATION_METRICS_TOKEN."""
+    token = settings.INSTRUMENTATION_METRICS_TOKEN
+    bearer = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not request.user.is_staff and not (token and constant_time_compare(bearer, token)):
+        return HttpResponseForbidden('Staff only.')
+    return HttpResponse(histograms.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
+
+def myaccount(request):
     if request.user.is_superuser:
         # Render admin myaccount template for superusers
         return render(request, 'tenanttalk/adminaccount.html')
     elif request.user.is_staff:
-        # Retrieve all reports for staff members
-
-        # staff_reports = Report.objects.all()
-        # return render(request, 'tenanttalk/staffaccount.html', {'staff_reports': staff_reports})
-
-        staff_reports = Report.objects.all()
-        report_files_mapping = {}
-        for report in staff_reports:
-            files = view_report_upload(report)
-            report_files_mapping[report] = files
-        return render(request, 'tenanttalk/staffaccount.html', {'staff_reports': staff_reports, 'report_files_mapping': report_files_mapping})
-    
+        # One column per open status, oldest first, first page only; the
+        # rest loads through staff_queue as the column is scrolled
+        queues = [
+            {'status': status, 'label': label, 'page': staff_queue_page(status)}
+            for status, label in STAFF_QUEUES
+        ]
+        return render(request, 'tenanttalk/staffaccount.html', {'queues': queues})
+
     elif request.user.is_authenticated:
         # Retrieve user's reports
         user_reports = Report.objects.filter(user=request.user.username)
 
-        items_per_page = 3
-        paginator = Paginator(user_reports, items_per_page)
+        items_page = paginate_request(request, user_reports, USER_REPORTS_ORDERING, settings.REPORTS_PER_PAGE)
 
-        try:
-            items_page = paginator.page(page)
-        except PageNotAnInteger:
-            items_page = paginator.page(default_page)
-        except EmptyPage:
-            items_page = paginator.page(paginator.num_pages)
-        
         # Pass the first report (if exists) to the template context
-        report = user_reports.first()
+        report = items_page.object_list[0] if items_page.object_list else None
         return render(request, 'tenanttalk/myaccount.html', {'user_reports': user_reports, 'report': report, 'items_page': items_page})
     else:
         # Render regular user myaccount template for non-authenticated users
         return render(request, 'tenanttalk/myaccount.html')
 
 
-def view_report(request, report_id):
-    report = get_object_or_404(Report, pk=report_id)
-    files = view_report_upload(report)
+async def view_report(request, report_id):
+    report = await aget_object_or_404(Report.objects.prefetch_related('attachments'), pk=report_id)
+    files = await async_attachment_links(report.attachments.all())
 
     if request.method == 'POST':
         # Handle feedback submission
@@ -187,88 +349,67 @@ def view_report(request, report_id):
 
         if resolve:
             report.status = 'RESOLVED'
-            report.verify = "TRUE"
+            report.verify = "T"
 
         if unresolve:
             report.status = 'RESOLVED'
 
         # Save the report
-        report.save()
+        await report.asave()
 
         # Redirect back to the same view
         return redirect('view_report', report_id=report_id)
 
-    return render(request, 'tenanttalk/viewreport.html', {'report': report, 'files': files})
+    return await async_render(request, 'tenanttalk/viewreport.html', {'report': report, 'files': files})
 
 
-def generate_presigned_url(bucket_name, key):
-    s3 = boto3.client('s3',
-                      aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                      aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                      region_name=settings.AWS_S3_REGION_NAME,
-                      config=boto3.session.Config(signature_version='s3v4'))
-    url = s3.generate_presigned_url(
-        'get_object',
-        Params={'Bucket': bucket_name, 'Key': key},
-        ExpiresIn=3600  # URL expires in 1 hour (adjust as needed)
-    )
-    return url
-
-
-def viewuploads(request):
-    if request.user.is_staff:
-        # Connect to S3
-        s3 = boto3.client('s3',
-                          aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                          aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY)
-
-        # Bucket name and folder prefix
-        bucket_name = settings.AWS_STORAGE_BUCKET_NAME
-        folder_prefix = ['pdfs/', 'txts/', 'jpgs/']
-        files = []
-
-        for folder in folder_prefix:
-            # List objects in the bucket with the specified prefix
-            response = s3.list_objects_v2(Bucket=bucket_name, Prefix=folder)
-
-            # Extract file names and generate download links
-            if 'Contents' in response:
-                for obj in response['Contents']:
-                    file_name = obj['Key'].split('/')[-1]
-                    file_key = obj['Key']
-                    file_url = generate_presigned_url(bucket_name, file_key)
-                    files.append({'name': file_name, 'url': file_url})
-
-        return render(request, 'tenanttalk/viewuploads.html', {'files': files})
-    else:
-        home(request)
+# Reports with the same file share its blobs/ key, so id breaks the tie
+UPLOADS_ORDERING = ('key', 'id')
 
-def view_user_uploads(request):
-    if not request.user.is_staff:
-        # Connect to S3
-        s3 = boto3.client('s3',
-                          aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                          aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY)
-
-        # Bucket name
-        bucket_name = settings.AWS_STORAGE_BUCKET_NAME
-        prefix = f'uploads/{request.user.username}/'
-        files = []
-
-        # List objects in the bucket with the specified prefix
-        response = s3.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
-
-        # Extract file names and generate download links
-        if 'Contents' in response:
-            for obj in response['Contents']:
-                file_name = obj['Key'].split('/')[-1]
-                file_key = obj['Key']
-                file_url = generate_presigned_url(bucket_name, file_key)
-                files.append({'name': file_name, 'url': file_url})
-                # CHANGE THIS TEMPLATE NAME
-            return render(request, 'tenanttalk/viewuploads.html', {'files': files})
+
+def bucket_page(after):
+    # Straight from S3 rather than the manifest, for files with no
+    # Attachment row (the legacy pdfs/, txts/ and jpgs/ ones among them); the
+    # prefixes are listed concurrently and the cursor is the last key shown
+    objects, next_after = get_file_store().list_page(BUCKET_PREFIXES, start_after=after,
+                                                     page_size=settings.UPLOADS_PER_PAGE)
+    return key_links(obj['Key'] for obj in objects), next_after
+
+
+async def viewuploads(request):
+    """Every uploaded file, a page at a time. ?source=bucket lists the
+    bucket itself instead of the Attachment manifest."""
+    user = await request.auser()
+    if user.is_staff:
+        if request.GET.get('source') == 'bucket':
+            files, next_after = await run_in_s3_pool(bucket_page)(request.GET.get('after'))
+            return await async_render(request, 'tenanttalk/viewuploads.html',
+                                      {'files': files, 'source': 'bucket', 'next_cursor': next_after})
+
+        items_page = await sync_to_async(paginate_request)(
+            request, Attachment.objects.all(), UPLOADS_ORDERING, settings.UPLOADS_PER_PAGE)
+        files = await async_attachment_links(items_page)
+        return await async_render(request, 'tenanttalk/viewuploads.html', {
+            'files': files,
+            'next_cursor': items_page.next_cursor,
+            'previous_cursor': items_page.previous_cursor,
+        })
+    else:
+        return await sync_to_async(home)(request)
+
+async def view_user_uploads(request):
+    user = await request.auser()
+    if not user.is_staff:
+        attachments = [
+            attachment
+            async for attachment in Attachment.objects.filter(report__user=user.username).order_by('key')
+        ]
+        files = await async_attachment_links(attachments)
+        if files:
+            # CHANGE THIS TEMPLATE NAME
+            return await async_render(request, 'tenanttalk/viewuploads.html', {'files': files})
         else:
-            home(request)
+            return await sync_to_async(home)(request)
 
 
 
@@ -339,26 +480,68 @@ def redirectToGoogle(request):
     suffix = urllib.parse.urlencode(url_params)
     return redirect(GOOGLE_LOGIN_URL_PREFIX + suffix)
 
-def view_report_upload(report):
-    # Connect to S3
-    s3 = boto3.client('s3',
-                      aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                      aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY)
-
-    # Bucket name
-    bucket_name = settings.AWS_STORAGE_BUCKET_NAME
-    post_id = report.post_title + '-' + report.time_stamp.strftime('%Y%m%d-%H%M')
-    prefix = f'uploads/{report.user}/{post_id}/'
-    files = []
-
-    # List objects in the bucket with the specified prefix
-    response = s3.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
-
-    # Extract file names and generate download links
-    if 'Contents' in response:
-        for obj in response['Contents']:
-            file_name = obj['Key'].split('/')[-1]
-            file_key = obj['Key']
-            file_url = generate_presigned_url(bucket_name, file_key)
-            files.append({'name': file_name, 'url': file_url})
-        return files
+def key_link(key, thumbnail='', name=None, store=None):
+    store = store or get_file_store()
+    name = name or key.split('/')[-1]
+    link = {'name': name, 'key': key, 'url': store.url(key, filename=name)}
+    if thumbnail:
+        link['thumbnail_url'] = store.url(thumbnail)
+    return link
+
+
+def key_links(keys):
+    store = get_file_store()
+    return [key_link(key, store=store) for key in keys]
+
+
+def direct_uploads_enabled():
+    return settings.REPORT_DIRECT_UPLOADS and get_file_store().direct_uploads
+
+
+# Types /files/ sends as they are: the report upload types and thumbnails.
+# Of those, images and PDFs open in the browser; the rest are downloads.
+SERVED_TYPES = {content_type for types in UPLOAD_FIELDS.values() for content_type in types} | {'image/webp'}
+INLINE_TYPES = {content_type for content_type in SERVED_TYPES
+                if content_type.startswith('image/') or content_type == 'application/pdf'}
+
+
+def attachment_file(request, token):
+    """A file from the local file store, for links made by LocalFileStore.url().
+    The signed token is the permission, as a presigned URL is on S3."""
+    store = get_file_store()
+    if not isinstance(store, LocalFileStore):
+        raise Http404
+    try:
+        key = store.key_for_url(token)
+    except signing.BadSignature:
+        raise Http404
+    if not default_storage.exists(key):
+        raise Http404
+
+    # Blob keys have no extension, so the type comes from the attachment.
+    # It was declared by whoever uploaded the file, so anything off the list
+    # goes out as bytes, and only images and PDFs open in the browser.
+    content_type, filename = (
+        Attachment.objects.filter(key=key).exclude(content_type='')
+        .values_list('content_type', 'filename').first()
+        or (mimetypes.guess_type(key)[0], '')
+    )
+    if content_type not in SERVED_TYPES:
+        content_type = 'application/octet-stream'
+    return file_response(request, store.path(key), content_type, filename=filename or key.rsplit('/', 1)[-1],
+                         as_attachment=content_type not in INLINE_TYPES)
+
+
+def attachment_links(attachments):
+    store = get_file_store()
+    return [key_link(attachment.key, attachment.thumbnail, attachment.name, store) for attachment in attachments]
+
+
+async def async_attachment_links(attachments):
+    # Signing can block on S3 credential refreshes, so it runs on the
+    # bounded S3 pool instead of the event loop
+    return await run_in_s3_pool(attachment_links)(list(attachments))
+
+
+# Templates read request.user and the session lazily, which is sync-only
+async_render = sync_to_async(render)